@@ -1,16 +1,28 @@
 # Importing necessary modules
 import asyncio
+import collections
 
 # Getting bot token from environment variables
 import os
 import time
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
 # Connecting to database
 from important_files.connection_to_database import *
+from important_files import (
+    guild_settings,
+    idempotency,
+    lag_watchdog,
+    levels,
+    responses,
+    role_rewards,
+    user_snapshot,
+    xp_decay,
+    xp_events,
+)
 
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
@@ -27,15 +39,46 @@ from cogs.super_admin_commands import super_admin_commands
 
 # Add the cogs to the bot (await the add_cog() method calls)
 async def setup():
+    # Preparing the xp event log (kept out of the imports, see xp_events.init)
+    xp_events.init()
     # Add the cogs to the bot
     await bot.add_cog(user_commands(bot))
     await bot.add_cog(admin_commands(bot))
     await bot.add_cog(super_admin_commands(bot))
 
 
+# Background task that folds the xp event log into the users table
+@tasks.loop(seconds=xp_events.COMPACTION_INTERVAL)
+async def compact_xp_events():
+    await xp_events.compact_in_thread()
+
+
+# Background task that refreshes the in-memory snapshot used by !stats
+@tasks.loop(seconds=user_snapshot.REFRESH_INTERVAL)
+async def refresh_user_snapshot():
+    await user_snapshot.refresh()
+
+
+# Background task that applies the daily xp decay of inactive users
+@tasks.loop(seconds=xp_decay.CHECK_INTERVAL)
+async def decay_inactive_users():
+    await xp_decay.run(bot)
+
+
 # Bot ready event listener
 @bot.event
 async def on_ready():
+    # Starting the xp event compactor (on_ready can fire again after a reconnect)
+    if not compact_xp_events.is_running():
+        compact_xp_events.start()
+    if not refresh_user_snapshot.is_running():
+        refresh_user_snapshot.start()
+    if not decay_inactive_users.is_running():
+        decay_inactive_users.start()
+    # Starting the level role rewards worker
+    role_rewards.start(bot)
+    # Starting the event loop lag watchdog
+    lag_watchdog.start()
     # Setting bot status and activity
     await bot.change_presence(
         status=discord.Status.online,
@@ -49,132 +92,112 @@ async def on_ready():
 # Importing config values from separate file
 from important_files.config import *
 
-# User's cooldown datas
+# User's cooldown datas: {(guild id, user id): cooldown end}
 cooldowns = {}
+# Most users a single message can give xp to
+MAX_RECIPIENTS = 10
 
+# Number of messages that left the xp pipeline at each stage (see !messagestats)
+message_stats = collections.Counter()
+bot.message_stats = message_stats
 
-# Message event listener for XP system
-@bot.event
-async def on_message(message):
-    global cooldowns
-    # Return if the message is sent by the bot itself
+
+# Stage 1: cheap checks that only read already parsed attributes (no allocation or await)
+def xp_precheck(message):
     if message.author.bot:
-        return
-    # Check for cooldown
-    user_id = message.author.id
-    current_time = time.time()
-    if user_id in cooldowns:
-        cooldown_end = cooldowns[user_id]
-        if current_time < cooldown_end:
-            # Ignore the message if the user is still on cooldown
-            return
-        else:
-            # Remove user from cooldowns if the cooldown has ended
-            del cooldowns[user_id]
-    # Check if the message contains any of the WORDS
-    elif any(word in message.content.lower() for word in WORDS):
-        # Check if the message is a reply or mentions the message author
-        is_reply_or_mention = False
-        if message.reference:
-            # Fetch the referenced message and check if its author is the message author
+        return "bot"
+    if message.guild is None:
+        return "dm"
+    if not message.mentions and message.reference is None:
+        return "no_target"
+    # Guild settings come from a cache, so this stays free of database queries
+    settings = guild_settings.get(message.guild.id)
+    if message.channel.id in settings.excluded_channels:
+        return "excluded_channel"
+    key = (message.guild.id, message.author.id)
+    cooldown_end = cooldowns.get(key)
+    if cooldown_end is not None:
+        if time.time() < cooldown_end:
+            return "cooldown"
+        # Remove user from cooldowns if the cooldown has ended
+        del cooldowns[key]
+    return None
+
+
+# Stage 2: keyword and target checks, then the xp award
+async def handle_xp(message):
+    settings = guild_settings.get(message.guild.id)
+    # Check if the message contains any of the guild's words
+    if settings.words_pattern.search(message.content.lower()) is None:
+        return "no_keyword"
+    targets = []
+    if message.reference:
+        # Use the referenced message sent with the event, fetch it only if it's missing
+        referenced_msg = message.reference.resolved
+        if not isinstance(referenced_msg, discord.Message):
             try:
                 referenced_msg = await message.channel.fetch_message(
                     message.reference.message_id
                 )
-                is_reply_or_mention = referenced_msg.author == message.author
             except discord.errors.NotFound:
-                pass
-        else:
-            # Check if the message mentions the message author
-            is_reply_or_mention = any(
-                user.id == message.author.id for user in message.mentions
-            )
-        # Do not give xp if message author replies or mentions themselves
-        if is_reply_or_mention:
-            return
-        user = None
-        # Extracting the user who is tagged or replied to in the message
-        if message.reference and not is_reply_or_mention:
-            referenced_msg = await message.channel.fetch_message(
-                message.reference.message_id
-            )
-            if referenced_msg.author.id != message.author.id:
-                user = referenced_msg.author
-        elif message.mentions:
-            user = message.mentions[0]
-        # If a valid user is found, add xp and level up accordingly
-        if user:
-            # Add user to cooldowns
-            cooldowns[user_id] = current_time + cooldown_duration_on_message
-            cursor = conn.cursor()
-            cursor.execute("SELECT xp, level FROM users WHERE id = ?", (user.id,))
-            result = cursor.fetchone()
-            if result is None:
-                # Insert new user with default level and xp if not found in the database
-                cursor.execute(
-                    "INSERT INTO users VALUES (?, ?, ?, ?)",
-                    (user.id, str(user), 0, min_level),
-                )
-                conn.commit()
-                # make embed message here
-            else:
-                # Add 1 xp to the user's current xp
-                xp, level = result
-                xp += 1
-                required_xp = level * 2 * level_xp_multiplier
-                required_xp = round(required_xp)
-                # Check if required xp is within the defined range
-                if required_xp > max_level_experience:
-                    required_xp = max_level_experience
-                elif required_xp < min_level_experience:
-                    required_xp = min_level_experience
-                # Creating check for level up or not.
-                level_check = False
-                # Level up and send an embed message if required xp is reached
-                if xp >= required_xp:
-                    level += 1
-                    xp = xp - required_xp
-                    channel = message.channel
-                    # We recalculate the amount of xp needed. (Because level is changed.)
-                    required_xp = level * 2 * level_xp_multiplier
-                    required_xp = round(required_xp)
-                    # Check if required xp is within the defined range
-                    if required_xp > max_level_experience:
-                        required_xp = max_level_experience
-                    elif required_xp < min_level_experience:
-                        required_xp = min_level_experience
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"🎉 You've leveled up {user}, congratulations!",
-                        value="",
-                        inline=False,
-                    )
-                    embed.set_footer(
-                        text=f"Your current level is {level}.\nFor the next level you must earn {required_xp} xp!"
-                    )
-                    await channel.send(embed=embed)
-                    level_check = True
-                # Clamp level to max level if it exceeds the max level
-                if level >= max_level:
-                    level = max_level
-                    xp = 0
-                # Update user's xp and level in the database
-                cursor.execute(
-                    "UPDATE users SET xp = ?, level = ? WHERE id = ?",
-                    (xp, level, user.id),
-                )
-                conn.commit()
-                if level_check == False:
-                    xp_percentage = int((xp / required_xp) * 100)
-                    channel = message.channel
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"🎊 You've earned an xp {user}!", value="", inline=False
-                    )
-                    embed.set_footer(text=f"XP: {xp}/{required_xp} ({xp_percentage}%)")
-                    await channel.send(embed=embed)
-    else:
-        # Process commands if the message does not contain any of the WORDS
+                referenced_msg = None
+        if referenced_msg is not None:
+            targets.append(referenced_msg.author)
+    targets += message.mentions
+    # Every mentioned user gets xp once, except the message author and bots
+    recipients = {}
+    for user in targets:
+        if user.id != message.author.id and not user.bot:
+            recipients.setdefault(user.id, user)
+    if not recipients:
+        if any(user.id == message.author.id for user in targets):
+            return "self_target"
+        return "bot_target" if targets else "no_target"
+    awards = []
+    for user in list(recipients.values())[:MAX_RECIPIENTS]:
+        amount = settings.xp_amount(message.channel.id, user)
+        if amount > 0:
+            awards.append((user, amount))
+    if not awards:
+        return "no_xp"
+    # Add user to cooldowns
+    cooldowns[(message.guild.id, message.author.id)] = time.time() + settings.cooldown
+    await award_xp(message, awards)
+    return "awarded"
+
+
+# Adding xp to the users (a list of (user, amount)) and level up accordingly
+async def award_xp(message, awards):
+    # Adding the xp of every user and appending it to the log in one transaction, before any await
+    results = xp_events.award_many(
+        xp_events.AWARD,
+        [(user.id, str(user), amount) for user, amount in awards],
+        message.author.id,
+    )
+    rendered = []
+    for (user, amount), (_, old_level, level, xp, _) in zip(awards, results):
+        if level > old_level:
+            role_rewards.queue(message.guild, user.id, level)
+        rendered.append((user, amount, old_level, level, xp, levels.required_xp(level)))
+    # Sending one embed for every user that earned xp
+    await message.channel.send(embed=responses.xp_awards(rendered))
+
+
+# Message event listener for XP system and commands
+@bot.event
+async def on_message(message):
+    # Dropping messages delivered again after a reconnect before doing any work
+    # (counted by idempotency and shown by !messagestats)
+    if idempotency.duplicate_message(message.id):
+        return
+    # The xp stages and command dispatch are independent, so a command can also give xp
+    stage = "error"
+    try:
+        stage = xp_precheck(message) or await handle_xp(message)
+    finally:
+        # A failed xp stage is counted as an error, and is raised after commands are dispatched
+        message_stats[stage] += 1
+        # Stage 3: command dispatch (process_commands ignores bots itself)
         await bot.process_commands(message)
 
 
@@ -1,9 +1,21 @@
 # Importing config values from separate file
+import math
+
 import discord
 from discord.ext import commands
 
 from important_files.config import *
 from important_files.connection_to_database import *
+from important_files import (
+    guild_settings,
+    idempotency,
+    name_index,
+    responses,
+    role_rewards,
+    user_snapshot,
+    xp_events,
+)
+from important_files.name_index import KnownUser
 
 
 class admin_commands(commands.Cog):
@@ -15,8 +27,10 @@ class admin_commands(commands.Cog):
         print("Admin commands cog is ready.")
 
     # Command to set a user's level
-    @commands.command()
-    async def setlevel(self, ctx, mentioned_user: discord.User, level_from_user: int):
+    @commands.hybrid_command(description="[Admin] Sets the level of a user.")
+    async def setlevel(self, ctx, mentioned_user: KnownUser, level_from_user: int):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
         # Checking if the user invoking the command is an admin
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
@@ -24,26 +38,12 @@ class admin_commands(commands.Cog):
         if result is not None or str(ctx.author.id) in super_admin_ids:
             if mentioned_user == None:
                 # If user didn't mention someone or put user's id, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name=f"❌ You need to mention user or put user's id.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NEED_USER)
             elif level_from_user == None:
                 # If user didn't put xp amount, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name=f"❌ You need to put level.", value="", inline=False
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NEED_LEVEL)
             else:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT xp, level FROM users WHERE id = ?", (mentioned_user.id,)
-                )
-                result = cursor.fetchone()
+                result = xp_events.current(mentioned_user.id)
                 check = 0
                 # Clamping level to max level if it exceeds the max level
                 if level_from_user > max_level:
@@ -54,98 +54,89 @@ class admin_commands(commands.Cog):
                     check = 2
                 # If user not found in database, insert new user with specified level and default XP
                 if result is None:
-                    cursor.execute(
-                        "INSERT INTO users VALUES (?, ?, ?, ?)",
-                        (mentioned_user.id, str(mentioned_user), level_from_user, 0),
+                    # The amount of a level set is the previous level, None for new users
+                    xp_events.record(
+                        xp_events.SET,
+                        mentioned_user.id,
+                        str(mentioned_user),
+                        None,
+                        level_from_user,
+                        0,
+                        ctx.author.id,
                     )
-                    conn.commit()
+                    # Queueing the level role rewards
+                    role_rewards.queue(ctx.guild, mentioned_user.id, level_from_user)
                     # Sending confirmation message
                     # Check if the user's level is within the defined minimum and maximum levels
                     if check == 0:
-                        embed = discord.Embed(color=discord.Color.green())
-                        embed.add_field(
-                            name=f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
-                            value="",
-                            inline=False,
+                        await ctx.send(
+                            embed=responses.success(
+                                f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
+                                footer=f"{mentioned_user} has been added to the database.",
+                            )
                         )
-                        embed.set_footer(
-                            text=f"{mentioned_user} has been added to the database."
-                        )
-                        await ctx.send(embed=embed)
                     # Check if the user's level is greater than the defined maximum level
                     elif check == 1:
-                        embed = discord.Embed(color=discord.Color.green())
-                        embed.add_field(
-                            name=f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
-                            value="",
-                            inline=False,
-                        )
-                        embed.set_footer(
-                            text=f"{mentioned_user} has been added to the database.\nMax level set to {max_level}."
+                        await ctx.send(
+                            embed=responses.success(
+                                f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
+                                footer=f"{mentioned_user} has been added to the database.\nMax level set to {max_level}.",
+                            )
                         )
-                        await ctx.send(embed=embed)
                     # Check if the user's level is less than the defined minimum level
                     else:
-                        embed = discord.Embed(color=discord.Color.green())
-                        embed.add_field(
-                            name=f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
-                            value="",
-                            inline=False,
+                        await ctx.send(
+                            embed=responses.success(
+                                f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
+                                footer=f"{mentioned_user} has been added to the database.\nMin level set to {min_level}.",
+                            )
                         )
-                        embed.set_footer(
-                            text=f"{mentioned_user} has been added to the database.\nMin level set to {min_level}."
-                        )
-                        await ctx.send(embed=embed)
                 # If user found in database, update their level and reset their XP to 0
                 else:
-                    cursor.execute(
-                        "UPDATE users SET xp = ?, level = ? WHERE id = ?",
-                        (0, level_from_user, mentioned_user.id),
+                    xp_events.record(
+                        xp_events.SET,
+                        mentioned_user.id,
+                        str(mentioned_user),
+                        result[0],
+                        level_from_user,
+                        0,
+                        ctx.author.id,
                     )
-                    conn.commit()
+                    # Queueing the level role rewards
+                    role_rewards.queue(ctx.guild, mentioned_user.id, level_from_user)
                     # Sending confirmation message
                     # Check if the user's level is within the defined minimum and maximum levels
                     if check == 0:
-                        embed = discord.Embed(color=discord.Color.green())
-                        embed.add_field(
-                            name=f"✅ **{mentioned_user}**'s level has been set to {level_from_user}.",
-                            value="",
-                            inline=False,
+                        await ctx.send(
+                            embed=responses.success(
+                                f"✅ **{mentioned_user}**'s level has been set to {level_from_user}."
+                            )
                         )
-                        await ctx.send(embed=embed)
                     # Check if the user's level is greater than the defined maximum level
                     elif check == 1:
-                        embed = discord.Embed(color=discord.Color.green())
-                        embed.add_field(
-                            name=f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
-                            value="",
-                            inline=False,
+                        await ctx.send(
+                            embed=responses.success(
+                                f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
+                                footer=f"Max level set to {max_level}.",
+                            )
                         )
-                        embed.set_footer(text=f"Max level set to {max_level}.")
-                        await ctx.send(embed=embed)
                     # Check if the user's level is less than the defined minimum level
                     else:
-                        embed = discord.Embed(color=discord.Color.green())
-                        embed.add_field(
-                            name=f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
-                            value="",
-                            inline=False,
+                        await ctx.send(
+                            embed=responses.success(
+                                f"✅ {mentioned_user}'s level has been set to {level_from_user}.",
+                                footer=f"Min level set to {min_level}.",
+                            )
                         )
-                        embed.set_footer(text=f"Min level set to {min_level}.")
-                        await ctx.send(embed=embed)
         # If user invoking the command is not an admin, send error message
         else:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.NO_PERMISSION)
 
     # Command to add XP to a user
-    @commands.command()
-    async def addxp(self, ctx, mentioned_user: discord.User, xp_amount_from_user: int):
+    @commands.hybrid_command(description="[Admin] Adds XP to a user.")
+    async def addxp(self, ctx, mentioned_user: KnownUser, xp_amount_from_user: int):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
         # Checking if the user invoking the command is an admin
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
@@ -153,97 +144,90 @@ class admin_commands(commands.Cog):
         if result is not None or str(ctx.author.id) in super_admin_ids:
             if mentioned_user == None:
                 # If user didn't mention someone or put user's id, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name=f"❌ You need to mention user or put user's id.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NEED_USER)
             elif xp_amount_from_user == None:
                 # If user didn't put xp amount, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name=f"❌ You need to put xp amount.", value="", inline=False
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NEED_XP_AMOUNT)
+            elif idempotency.duplicate_command("addxp", ctx.message.id):
+                # The same invocation was delivered again, the xp has already been added
+                await ctx.send(embed=responses.ALREADY_RUN)
             else:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT xp, level FROM users WHERE id = ?", (mentioned_user.id,)
+                # Adding the xp and appending it to the log in one step
+                old_level, level, xp, new_user = xp_events.award(
+                    xp_events.GRANT,
+                    mentioned_user.id,
+                    str(mentioned_user),
+                    xp_amount_from_user,
+                    ctx.author.id,
                 )
-                result = cursor.fetchone()
-                # If user not found in database, insert new user with default level and specified XP
-                if result is None:
-                    level = 1
-                    xp = xp_amount_from_user
-                    required_xp = level * 2 * level_xp_multiplier
-                    required_xp = round(required_xp)
-                    if required_xp > max_level_experience:
-                        required_xp = max_level_experience
-                    elif required_xp < min_level_experience:
-                        required_xp = min_level_experience
-                    while xp >= required_xp:
-                        level += 1
-                        xp = xp - required_xp
-                    cursor.execute(
-                        "INSERT INTO users VALUES (?, ?, ?, ?)",
-                        (mentioned_user.id, str(mentioned_user), level, xp),
+                # Queueing the level role rewards
+                if level != old_level:
+                    role_rewards.queue(ctx.guild, mentioned_user.id, level)
+                # Sending confirmation message
+                # If user wasn't in the database, they have been added with default level
+                await ctx.send(
+                    embed=responses.success(
+                        f"✅ Added {xp_amount_from_user} xp to {mentioned_user}.",
+                        footer=f"{mentioned_user} has been added to the database."
+                        if new_user
+                        else None,
                     )
-                    conn.commit()
-                    # Sending confirmation message
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"✅ Added {xp_amount_from_user} xp to {mentioned_user}.",
-                        value="",
-                        inline=False,
-                    )
-                    embed.set_footer(
-                        text=f"{mentioned_user} has been added to the database."
-                    )
-                    await ctx.send(embed=embed)
-                # If user found in database, update their XP and level accordingly
-                else:
-                    xp, level = result
-                    xp += xp_amount_from_user
-                    required_xp = level * 2 * level_xp_multiplier
-                    required_xp = round(required_xp)
-                    if required_xp > max_level_experience:
-                        required_xp = max_level_experience
-                    elif required_xp < min_level_experience:
-                        required_xp = min_level_experience
-                    while xp >= required_xp:
-                        level += 1
-                        xp = xp - required_xp
-                    if level >= max_level:
-                        level = max_level
-                        xp = 0
-                    cursor.execute(
-                        "UPDATE users SET xp = ?, level = ? WHERE id = ?",
-                        (xp, level, mentioned_user.id),
-                    )
-                    conn.commit()
-                    # Sending confirmation message
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"✅ Added {xp_amount_from_user} xp to {mentioned_user}.",
-                        value="",
-                        inline=False,
-                    )
-                    await ctx.send(embed=embed)
+                )
         # If user invoking the command is not an admin, send error message
         else:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to preview how levels would change with a different level_xp_multiplier
+    @commands.hybrid_command(description="[Admin] Previews levels with a different level XP multiplier.")
+    async def whatif(self, ctx, multiplier: float):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if multiplier <= 0:
+                # If user put a multiplier that isn't positive, send error message
+                await ctx.send(embed=responses.MULTIPLIER_NOT_POSITIVE)
+            else:
+                # Recalculating every user's level from the in-memory snapshot
+                preview = (await user_snapshot.get()).what_if(multiplier)
+                embed = responses.embed(
+                    title="What If",
+                    description=f"Levels with a multiplier of {multiplier} instead of {level_xp_multiplier}",
+                    fields=[
+                        (
+                            "Users",
+                            f"Level up: {preview['up']}\nLevel down: {preview['down']}\nSame level: {preview['same']}",
+                            True,
+                        ),
+                        (
+                            "Levels",
+                            f"Average change: {preview['mean_change']:+.2f}\nAt max level: {preview['max_level_users']}",
+                            True,
+                        ),
+                    ],
+                )
+                await ctx.send(embed=embed)
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Suggesting known user names from memory for the user arguments
+    @setlevel.autocomplete("mentioned_user")
+    async def setlevel_user_autocomplete(self, interaction, current):
+        return await name_index.autocomplete(interaction, current)
+
+    @addxp.autocomplete("mentioned_user")
+    async def addxp_user_autocomplete(self, interaction, current):
+        return await name_index.autocomplete(interaction, current)
 
     # Command to show all admins from the database
-    @commands.command()
+    @commands.hybrid_command(description="[Admin] Shows a list of all the admins.")
     async def showadmins(self, ctx):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
         # Checking if the user invoking the command is an admin
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
@@ -255,32 +239,253 @@ class admin_commands(commands.Cog):
             result = cursor.fetchall()
             if not result:
                 # If there are no admins in the database, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name="❌ There are no admins in the database.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NO_ADMINS)
             else:
                 # Creating an embed message with the list of admins
-                embed = discord.Embed(
-                    title="Admin List", description="List of all admins", color=0x00C3FF
+                embed = responses.embed(
+                    title="Admin List",
+                    description="List of all admins",
+                    fields=[(f"ID: {row[0]}", f"Name: {row[1]}", False) for row in result],
                 )
-                for row in result:
-                    embed.add_field(
-                        name=f"ID: {row[0]}", value=f"Name: {row[1]}", inline=False
+                await ctx.send(embed=embed)
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to give or remove level roles of every member so they match their level
+    @commands.hybrid_command(description="[Admin] Updates the level roles of every member.")
+    async def syncroles(self, ctx):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if not role_rewards.level_roles:
+                # If no level roles are configured, send error message
+                await ctx.send(embed=responses.NO_LEVEL_ROLES)
+            else:
+                queued = role_rewards.reconcile(ctx.guild)
+                # Sending confirmation message
+                await ctx.send(
+                    embed=responses.success(
+                        f"✅ Level roles of {queued} members will be updated."
                     )
+                )
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to show the xp settings of the server
+    @commands.hybrid_command(description="[Admin] Shows the XP settings of this server.")
+    async def xpsettings(self, ctx):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if ctx.guild is None:
+                # Guild settings can't be changed in direct messages
+                await ctx.send(embed=responses.SERVER_ONLY)
+            else:
+                settings = guild_settings.get(ctx.guild.id)
+                embed = responses.embed(
+                    title="XP settings",
+                    color=responses.BLUE,
+                    fields=[
+                        ("Words", ", ".join(settings.words) or "None", False),
+                        ("Cooldown", f"{settings.cooldown} seconds", False),
+                        (
+                            "Excluded channels",
+                            " ".join(f"<#{channel_id}>" for channel_id in settings.excluded_channels)
+                            or "None",
+                            False,
+                        ),
+                        (
+                            "Channel multipliers",
+                            "\n".join(
+                                f"<#{channel_id}>: x{multiplier:g}"
+                                for channel_id, multiplier in settings.channel_multipliers.items()
+                            )
+                            or "None",
+                            False,
+                        ),
+                        (
+                            "Role boosts",
+                            "\n".join(
+                                f"<@&{role_id}>: x{boost:g}"
+                                for role_id, boost in settings.role_boosts.items()
+                            )
+                            or "None",
+                            False,
+                        ),
+                    ],
+                )
                 await ctx.send(embed=embed)
         # If user invoking the command is not an admin, send error message
         else:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to set the words that give xp in the server ("default" restores the config's WORDS)
+    @commands.hybrid_command(description="[Admin] Sets the comma separated words that give XP in this server.")
+    async def setwords(self, ctx, *, words: str):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if ctx.guild is None:
+                # Guild settings can't be changed in direct messages
+                await ctx.send(embed=responses.SERVER_ONLY)
+            else:
+                if words.strip().lower() == "default":
+                    word_list = list(WORDS)
+                else:
+                    word_list = [word.strip() for word in words.split(",") if word.strip()]
+                guild_settings.update(ctx.guild.id, words=word_list)
+                # Sending confirmation message
+                await ctx.send(
+                    embed=responses.success(
+                        f"✅ {len(word_list)} words will give XP in this server.",
+                    )
+                )
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to set the cooldown between two xp giving messages of a user in the server
+    @commands.hybrid_command(description="[Admin] Sets the XP cooldown of this server in seconds.")
+    async def setcooldown(self, ctx, seconds: int):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if ctx.guild is None:
+                # Guild settings can't be changed in direct messages
+                await ctx.send(embed=responses.SERVER_ONLY)
+            elif seconds < 0:
+                await ctx.send(embed=responses.NEGATIVE_COOLDOWN)
+            else:
+                guild_settings.update(ctx.guild.id, cooldown=seconds)
+                # Sending confirmation message
+                await ctx.send(
+                    embed=responses.success(
+                        f"✅ The XP cooldown of this server is now {seconds} seconds.",
+                    )
+                )
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to stop or start giving xp in a channel
+    @commands.hybrid_command(description="[Admin] Stops or starts giving XP in a channel.")
+    async def excludechannel(self, ctx, channel: discord.TextChannel):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if ctx.guild is None:
+                # Guild settings can't be changed in direct messages
+                await ctx.send(embed=responses.SERVER_ONLY)
+            else:
+                excluded = set(guild_settings.get(ctx.guild.id).excluded_channels)
+                if channel.id in excluded:
+                    excluded.remove(channel.id)
+                    text = f"✅ Messages in #{channel.name} give XP again."
+                else:
+                    excluded.add(channel.id)
+                    text = f"✅ Messages in #{channel.name} won't give XP anymore."
+                guild_settings.update(ctx.guild.id, excluded_channels=sorted(excluded))
+                # Sending confirmation message
+                await ctx.send(embed=responses.success(text))
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to multiply the xp given in a channel (1 removes the multiplier)
+    @commands.hybrid_command(description="[Admin] Sets the XP multiplier of a channel.")
+    async def channelmultiplier(self, ctx, channel: discord.TextChannel, multiplier: float):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if ctx.guild is None:
+                # Guild settings can't be changed in direct messages
+                await ctx.send(embed=responses.SERVER_ONLY)
+            elif not math.isfinite(multiplier):
+                # The float converter also accepts inf and nan
+                await ctx.send(embed=responses.MULTIPLIER_NOT_FINITE)
+            elif multiplier < 0:
+                await ctx.send(embed=responses.NEGATIVE_MULTIPLIER)
+            else:
+                multipliers = {
+                    str(channel_id): value
+                    for channel_id, value in guild_settings.get(ctx.guild.id).channel_multipliers.items()
+                }
+                multipliers.pop(str(channel.id), None)
+                if multiplier != 1:
+                    multipliers[str(channel.id)] = multiplier
+                guild_settings.update(ctx.guild.id, channel_multipliers=multipliers)
+                # Sending confirmation message
+                await ctx.send(
+                    embed=responses.success(
+                        f"✅ XP in #{channel.name} is now multiplied by {multiplier:g}.",
+                    )
+                )
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to multiply the xp earned by members with a role (1 removes the boost)
+    @commands.hybrid_command(description="[Admin] Sets the XP boost of a role.")
+    async def roleboost(self, ctx, role: discord.Role, boost: float):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        # Checking if the user invoking the command is an admin
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM admins WHERE id = ?", (ctx.author.id,))
+        result = cursor.fetchone()
+        if result is not None or str(ctx.author.id) in super_admin_ids:
+            if ctx.guild is None:
+                # Guild settings can't be changed in direct messages
+                await ctx.send(embed=responses.SERVER_ONLY)
+            elif not math.isfinite(boost):
+                # The float converter also accepts inf and nan
+                await ctx.send(embed=responses.BOOST_NOT_FINITE)
+            elif boost < 0:
+                await ctx.send(embed=responses.NEGATIVE_BOOST)
+            else:
+                boosts = {
+                    str(role_id): value
+                    for role_id, value in guild_settings.get(ctx.guild.id).role_boosts.items()
+                }
+                boosts.pop(str(role.id), None)
+                if boost != 1:
+                    boosts[str(role.id)] = boost
+                guild_settings.update(ctx.guild.id, role_boosts=boosts)
+                # Sending confirmation message
+                await ctx.send(
+                    embed=responses.success(
+                        f"✅ XP earned by members with {role.name} is now multiplied by {boost:g}.",
+                    )
+                )
+        # If user invoking the command is not an admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
 
 
 def setup(bot):
@@ -6,11 +6,14 @@ from discord.ext import commands
 
 from important_files.config import *
 from important_files.connection_to_database import *
+from important_files import idempotency, lag_watchdog, responses, role_rewards, xp_events
+from important_files.profiler import Profiler
 
 
 class super_admin_commands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.running_profiler = None
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -23,13 +26,7 @@ class super_admin_commands(commands.Cog):
         if str(ctx.author.id) in super_admin_ids:
             if mentioned_user == None:
                 # If user didn't mention someone or put user's id, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name=f"❌ You need to mention user or put user's id.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NEED_USER)
             else:
                 cursor = conn.cursor()
                 # Checking if the user is already an admin
@@ -39,13 +36,9 @@ class super_admin_commands(commands.Cog):
                 result = cursor.fetchone()
                 # If user is already an admin, send error message
                 if result is not None:
-                    embed = discord.Embed(color=discord.Color.red())
-                    embed.add_field(
-                        name=f"❌ {mentioned_user} is already an admin.",
-                        value="",
-                        inline=False,
+                    await ctx.send(
+                        embed=responses.error(f"❌ {mentioned_user} is already an admin.")
                     )
-                    await ctx.send(embed=embed)
                 # If user is not an admin, add user as an admin to the database
                 else:
                     cursor.execute(
@@ -54,22 +47,12 @@ class super_admin_commands(commands.Cog):
                     )
                     conn.commit()
                     # Sending confirmation message
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"✅ {mentioned_user} has been added as an admin.",
-                        value="",
-                        inline=False,
+                    await ctx.send(
+                        embed=responses.success(f"✅ {mentioned_user} has been added as an admin.")
                     )
-                    await ctx.send(embed=embed)
         # If user invoking the command is not a super admin, send error message
         else:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.NO_PERMISSION)
 
     # Command to remove an admin from the database
     @commands.command()
@@ -78,13 +61,7 @@ class super_admin_commands(commands.Cog):
         if str(ctx.author.id) in super_admin_ids:
             if mentioned_user == None:
                 # If user didn't mention someone or put user's id, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name=f"❌ You need to mention user or put user's id.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NEED_USER)
             else:
                 # Removing the mentioned_user ID from the list of admin IDs
                 cursor = conn.cursor()
@@ -98,46 +75,27 @@ class super_admin_commands(commands.Cog):
                     )
                     conn.commit()
                     # Sending confirmation message
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"✅ {mentioned_user} is no longer an admin.",
-                        value="",
-                        inline=False,
+                    await ctx.send(
+                        embed=responses.success(f"✅ {mentioned_user} is no longer an admin.")
                     )
-                    await ctx.send(embed=embed)
                 else:
                     # Sending error message if mentioned_user is not found in the database
-                    embed = discord.Embed(color=discord.Color.red())
-                    embed.add_field(
-                        name=f"⛔ {mentioned_user} is not an admin.",
-                        value="",
-                        inline=False,
-                    )
-                    await ctx.send(embed=embed)
+                    await ctx.send(embed=responses.error(f"⛔ {mentioned_user} is not an admin."))
         else:
             # If user invoking the command is not a super admin, send error message
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.NO_PERMISSION)
 
     # Command that resets the level and XP of all users in the database
     @commands.command()
     async def resetall(self, ctx):
         # Checking if the user invoking the command is a super admin
         if str(ctx.author.id) in super_admin_ids:
-            cursor = conn.cursor()
+            if idempotency.duplicate_command("resetall", ctx.message.id):
+                # The same invocation was delivered again, it has already been run
+                await ctx.send(embed=responses.ALREADY_RUN)
+                return
             # Warning message to confirm action
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name="⚠️ WARNING: This action will reset all users' levels and XP. Are you sure?",
-                value="",
-                inline=False,
-            )
-            warning = await ctx.send(embed=embed)
+            warning = await ctx.send(embed=responses.RESET_WARNING)
             # Waiting for confirmation from user
             await warning.add_reaction("✅")
             await warning.add_reaction("❌")
@@ -153,45 +111,27 @@ class super_admin_commands(commands.Cog):
                     return
             except asyncio.TimeoutError:
                 await warning.delete()
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name="❌ Command timed out. Please try again.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.TIMED_OUT)
             else:
                 # If user confirms action, reset all user levels and XP in the database
                 if str(reaction.emoji) == "✅":
-                    cursor.execute("UPDATE users SET level = 0, xp = 0")
-                    conn.commit()
+                    xp_events.record(xp_events.RESET, None, None, 0, 0, 0, user.id)
+                    # Removing the level roles of every member
+                    role_rewards.reconcile(ctx.guild)
                     # Sending confirmation message with the name of the super admin who did it
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"✅ All users' levels and XP have been reset by {user}.",
-                        value=f"ID: {user.id}",
-                        inline=False,
+                    await ctx.send(
+                        embed=responses.success(
+                            f"✅ All users' levels and XP have been reset by {user}.",
+                            f"ID: {user.id}",
+                        )
                     )
-                    await ctx.send(embed=embed)
                 # If user cancels action, send error message
                 elif str(reaction.emoji) == "❌":
                     await warning.delete()
-                    embed = discord.Embed(color=discord.Color.red())
-                    embed.add_field(
-                        name="❌ Command cancelled. No changes have been made.",
-                        value="",
-                        inline=False,
-                    )
-                    await ctx.send(embed=embed)
+                    await ctx.send(embed=responses.CANCELLED)
         # If user invoking the command is not a super admin, send error message
         else:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.NO_PERMISSION)
 
     # Command to delete a user from the database
     @commands.command()
@@ -199,48 +139,38 @@ class super_admin_commands(commands.Cog):
         if str(ctx.author.id) in super_admin_ids:
             if mentioned_user == None:
                 # If user didn't mention someone or put user's id, send error message
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name=f"❌ You need to mention user or put user's id.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.NEED_USER)
             else:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM users WHERE id = ?", (mentioned_user.id,))
-                conn.commit()
+                xp_events.record(
+                    xp_events.DELETE,
+                    mentioned_user.id,
+                    str(mentioned_user),
+                    0,
+                    None,
+                    None,
+                    ctx.author.id,
+                )
+                role_rewards.queue(ctx.guild, mentioned_user.id, 0)
                 # Sending confirmation message
-                embed = discord.Embed(color=discord.Color.green())
-                embed.add_field(
-                    name=f"✅ {mentioned_user} has been deleted from the database.",
-                    value="",
-                    inline=False,
+                await ctx.send(
+                    embed=responses.success(
+                        f"✅ {mentioned_user} has been deleted from the database.",
+                    )
                 )
-                await ctx.send(embed=embed)
         # If user invoking the command is not a super admin, send error message
         else:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.NO_PERMISSION)
 
     # Command to delete all users from the database
     @commands.command()
     async def deleteusers(self, ctx):
         if str(ctx.author.id) in super_admin_ids:
-            cursor = conn.cursor()
+            if idempotency.duplicate_command("deleteusers", ctx.message.id):
+                # The same invocation was delivered again, it has already been run
+                await ctx.send(embed=responses.ALREADY_RUN)
+                return
             # Warning message to confirm action
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name="⚠️ WARNING: This action will delete all users with their levels and XP. Are you sure?",
-                value="",
-                inline=False,
-            )
-            warning = await ctx.send(embed=embed)
+            warning = await ctx.send(embed=responses.DELETE_ALL_WARNING)
             # Waiting for confirmation from user
             await warning.add_reaction("✅")
             await warning.add_reaction("❌")
@@ -256,45 +186,141 @@ class super_admin_commands(commands.Cog):
                     return
             except asyncio.TimeoutError:
                 await warning.delete()
-                embed = discord.Embed(color=discord.Color.red())
-                embed.add_field(
-                    name="❌ Command timed out. Please try again.",
-                    value="",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
+                await ctx.send(embed=responses.TIMED_OUT)
             else:
                 # If user confirms action, delete all user from the database
                 if str(reaction.emoji) == "✅":
-                    cursor.execute("DELETE FROM users")
-                    conn.commit()
+                    xp_events.record(xp_events.DELETE, None, None, 0, None, None, user.id)
+                    # Removing the level roles of every member
+                    role_rewards.reconcile(ctx.guild)
                     # Sending confirmation message with the name of the super admin who did it
-                    embed = discord.Embed(color=discord.Color.green())
-                    embed.add_field(
-                        name=f"✅ All users have been deleted from the database by {user}.",
-                        value=f"ID: {user.id}",
-                        inline=False,
+                    await ctx.send(
+                        embed=responses.success(
+                            f"✅ All users have been deleted from the database by {user}.",
+                            f"ID: {user.id}",
+                        )
                     )
-                    await ctx.send(embed=embed)
                 # If user cancels action, send error message
                 elif str(reaction.emoji) == "❌":
                     await warning.delete()
-                    embed = discord.Embed(color=discord.Color.red())
-                    embed.add_field(
-                        name="❌ Command cancelled. No changes have been made.",
-                        value="",
-                        inline=False,
-                    )
-                    await ctx.send(embed=embed)
+                    await ctx.send(embed=responses.CANCELLED)
         # If user invoking the command is not a super admin, send error message
         else:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name="⛔ You don't have enough permission for this command.",
-                value="",
-                inline=False,
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to show where messages leave the on_message xp pipeline
+    @commands.command()
+    async def messagestats(self, ctx):
+        if str(ctx.author.id) in super_admin_ids:
+            message_stats = getattr(self.bot, "message_stats", {})
+            fields = []
+            if not message_stats:
+                fields.append(("No messages have been processed yet.", "", False))
+            for stage, count in sorted(
+                message_stats.items(), key=lambda item: item[1], reverse=True
+            ):
+                fields.append((stage, str(count), True))
+            # Duplicate deliveries that were dropped (messages and commands)
+            for kind, count in sorted(idempotency.suppressed.items()):
+                fields.append((f"Suppressed duplicate {kind}", str(count), True))
+            embed = responses.embed(
+                title="Message Stats",
+                description="Number of messages that left the xp pipeline at each stage",
+                fields=fields,
+            )
+            await ctx.send(embed=embed)
+        # If user invoking the command is not a super admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to show how late the event loop has been running
+    @commands.command()
+    async def lagstats(self, ctx):
+        if str(ctx.author.id) in super_admin_ids:
+            measurements, blocks, highest = lag_watchdog.totals
+            embed = responses.embed(
+                title="Event Loop Lag",
+                description=f"{measurements} measurements, highest lag {highest * 1000:.0f} ms\n"
+                f"{blocks} blocks over {lag_watchdog.BLOCK_THRESHOLD * 1000:.0f} ms, "
+                f"their stacks are in {lag_watchdog.LOG_DIR}/{lag_watchdog.LOG_FILE}",
+                fields=[
+                    (label, str(count), True)
+                    for label, count in lag_watchdog.buckets()
+                    if count
+                ],
             )
             await ctx.send(embed=embed)
+        # If user invoking the command is not a super admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to profile the running bot for a number of seconds
+    @commands.command()
+    async def profile(self, ctx, seconds: int = 10):
+        if str(ctx.author.id) in super_admin_ids:
+            if self.running_profiler is not None:
+                # Only one profiler can run at a time
+                await ctx.send(embed=responses.PROFILE_RUNNING)
+                return
+            # Clamping the duration so a profile can't run forever
+            seconds = max(1, min(seconds, 300))
+            await ctx.send(
+                embed=responses.warning(f"⏱️ Profiling the bot for {seconds} seconds...")
+            )
+            running_profiler = Profiler(asyncio.get_running_loop())
+            self.running_profiler = running_profiler
+            running_profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                running_profiler.stop()
+                self.running_profiler = None
+            path = await asyncio.to_thread(running_profiler.write)
+            # Sending a short summary with the collapsed stack file
+            top_functions = running_profiler.top_functions(10)
+            total = running_profiler.samples or 1
+            top_coroutines = running_profiler.top_coroutines(5)
+            embed = responses.embed(
+                title="Profile",
+                description=f"{running_profiler.samples} samples in {running_profiler.duration:.1f} seconds",
+                fields=[
+                    (
+                        "Top functions",
+                        "\n".join(
+                            f"{count * 100 // total}% {name}" for name, count in top_functions
+                        )[:1024]
+                        or "No samples.",
+                        False,
+                    ),
+                    (
+                        "Top coroutines by await time",
+                        "\n".join(
+                            f"{name}: {calls} calls, {running:.3f}s running, {awaiting:.3f}s awaiting"
+                            for name, calls, running, awaiting in top_coroutines
+                        )[:1024]
+                        or "No finished coroutines.",
+                        False,
+                    ),
+                ],
+                footer=f"Saved to {path}",
+            )
+            await ctx.send(embed=embed, file=discord.File(path))
+        # If user invoking the command is not a super admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
+
+    # Command to register the slash commands with Discord
+    @commands.command()
+    async def synccommands(self, ctx):
+        if str(ctx.author.id) in super_admin_ids:
+            synced = await self.bot.tree.sync()
+            # Sending confirmation message
+            await ctx.send(
+                embed=responses.success(f"✅ {len(synced)} slash commands have been synced.")
+            )
+        # If user invoking the command is not a super admin, send error message
+        else:
+            await ctx.send(embed=responses.NO_PERMISSION)
 
 
 def setup(bot):
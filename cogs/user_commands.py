@@ -1,6 +1,8 @@
 # Importing config values from separate file
 import asyncio
+import io
 import math
+from concurrent.futures.process import BrokenProcessPool
 
 import discord
 from discord.ext import commands
@@ -8,6 +10,16 @@ from discord.ext.commands import BucketType, CommandOnCooldown, cooldown
 
 from important_files.config import *
 from important_files.connection_to_database import *
+from important_files import (
+    levels,
+    name_index,
+    rank_cards,
+    responses,
+    user_snapshot,
+    xp_buckets,
+    xp_events,
+)
+from important_files.name_index import KnownUser
 
 
 class user_commands(commands.Cog):
@@ -16,19 +28,81 @@ class user_commands(commands.Cog):
         self.help_cooldown_users = set()
         self.progress_cooldown_users = set()
         self.leaderboard_cooldown_users = set()
+        self.stats_cooldown_users = set()
 
     @commands.Cog.listener()
     async def on_ready(self):
         print("User commands cog is ready.")
 
-    # Command to show the leaderboard of the top 5 users by level
-    @commands.command()
+    # Command to show the leaderboard of the top 5 users by level, or by xp earned this week or month
+    @commands.hybrid_command(description="Shows the top users by level, or by XP this week or month.")
     @cooldown(1, cooldown_duration_commands, BucketType.user)
-    async def leaderboard(self, ctx):
+    async def leaderboard(self, ctx, time_range: str = "all"):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        time_range = time_range.lower()
+        if time_range != "all" and time_range not in xp_buckets.WINDOWS:
+            # If user put an unknown time range, send error message
+            await ctx.send(embed=responses.BAD_TIME_RANGE)
+            return
         check = False
-        embed = discord.Embed(
-            title="Leaderboard", description="Top 5 Users by Level", color=0x00C3FF
-        )
+        # Folding pending xp events so the leaderboard is up to date
+        xp_events.compact()
+        if time_range in xp_buckets.WINDOWS:
+            # Answering from the rolling xp counters instead of scanning the history
+            fields = []
+            result = xp_buckets.top(time_range, 5)
+            ids = [user_id for user_id, _ in result]
+            c.execute(
+                f"SELECT id, name FROM users WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            )
+            names = dict(c.fetchall())
+            for i, (user_id, xp) in enumerate(result, start=1):
+                if user_id == ctx.author.id:
+                    fields.append(
+                        (
+                            f"{i}. {names.get(user_id)} (You)",
+                            f"XP this {time_range}: {xp}",
+                            False,
+                        )
+                    )
+                    check = True
+                else:
+                    fields.append(
+                        (
+                            f"{i}. {names.get(user_id)}",
+                            f"XP this {time_range}: {xp}",
+                            False,
+                        )
+                    )
+            if check == False:
+                result = xp_buckets.rank(time_range, ctx.author.id)
+                if result is not None:
+                    xp, rank = result
+                    fields.append(
+                        (
+                            f"{ctx.author} (You)",
+                            f"XP this {time_range}: {xp}\nRank: {rank}",
+                            False,
+                        )
+                    )
+                else:
+                    fields.append(
+                        (
+                            f"{ctx.author} (You)",
+                            f"You haven't earned any XP this {time_range}.",
+                            False,
+                        )
+                    )
+            embed = responses.embed(
+                title="Leaderboard",
+                description=f"Top 5 Users by XP this {time_range}",
+                fields=fields,
+            )
+            await ctx.send(embed=embed)
+            return
+        fields = []
         c.execute(
             "SELECT name, level, xp FROM users ORDER BY level DESC, xp DESC LIMIT 5"
         )
@@ -41,30 +115,38 @@ class user_commands(commands.Cog):
             xp = row[2]
             if str(name) == str(ctx.author):
                 if level == max_level:
-                    embed.add_field(
-                        name=f"{i}. {name} (You)",
-                        value=f"Level: {level}\nReached max level.",
-                        inline=False,
+                    fields.append(
+                        (
+                            f"{i}. {name} (You)",
+                            f"Level: {level}\nReached max level.",
+                            False,
+                        )
                     )
                 else:
-                    embed.add_field(
-                        name=f"{i}. {name} (You)",
-                        value=f"Level: {level}\nXP: {xp}",
-                        inline=False,
+                    fields.append(
+                        (
+                            f"{i}. {name} (You)",
+                            f"Level: {level}\nXP: {xp}",
+                            False,
+                        )
                     )
                 check = True
             else:
                 if level == max_level:
-                    embed.add_field(
-                        name=f"{i}. {name}",
-                        value=f"Level: {level}\nReached max level.",
-                        inline=False,
+                    fields.append(
+                        (
+                            f"{i}. {name}",
+                            f"Level: {level}\nReached max level.",
+                            False,
+                        )
                     )
                 else:
-                    embed.add_field(
-                        name=f"{i}. {name}",
-                        value=f"Level: {level}\nXP: {xp}",
-                        inline=False,
+                    fields.append(
+                        (
+                            f"{i}. {name}",
+                            f"Level: {level}\nXP: {xp}",
+                            False,
+                        )
                     )
             i += 1
         # Checking the rank of the user invoking the command and adding their rank to the embed if they're in the top 5
@@ -81,110 +163,161 @@ class user_commands(commands.Cog):
             rank = c.fetchone()[0] + 1
             if check == False:
                 if level == max_level:
-                    embed.add_field(
-                        name=f"{name} (You)",
-                        value=f"Level: {level}\nReached max level.\nRank: {rank}",
-                        inline=False,
+                    fields.append(
+                        (
+                            f"{name} (You)",
+                            f"Level: {level}\nReached max level.\nRank: {rank}",
+                            False,
+                        )
                     )
                 else:
-                    embed.add_field(
-                        name=f"{name} (You)",
-                        value=f"Level: {level}\nXP: {xp}\nRank: {rank}",
-                        inline=False,
+                    fields.append(
+                        (
+                            f"{name} (You)",
+                            f"Level: {level}\nXP: {xp}\nRank: {rank}",
+                            False,
+                        )
                     )
         else:
-            embed.add_field(
-                name=f"{ctx.author} (You)",
-                value=f"You don't have any XP and Level.",
-                inline=False,
+            fields.append(
+                (
+                    f"{ctx.author} (You)",
+                    f"You don't have any XP and Level.",
+                    False,
+                )
             )
+        embed = responses.embed(
+            title="Leaderboard", description="Top 5 Users by Level", fields=fields
+        )
         await ctx.send(embed=embed)
 
     # Command to show user's own or tagged user's XP and level progress
-    @commands.command()
+    @commands.hybrid_command(description="Shows your or another user's progress towards the next level.")
     @cooldown(1, cooldown_duration_commands, BucketType.user)
-    async def progress(self, ctx, user: discord.User = None):
+    async def progress(self, ctx, user: KnownUser = None):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
         # If no user is tagged, show progress of the message author
         if user is None:
             user = ctx.author
-        cursor = conn.cursor()
-        cursor.execute("SELECT xp, level FROM users WHERE id = ?", (user.id,))
-        result = cursor.fetchone()
+        result = xp_events.current(user.id)
         # If user not found in database, send error message
         if result is None:
-            embed = discord.Embed(color=discord.Color.red())
-            embed.add_field(
-                name=f"❗ User not found in database.", value="", inline=False
-            )
-            await ctx.send(embed=embed)
+            await ctx.send(embed=responses.USER_NOT_FOUND)
         else:
-            xp, level = result
-            required_xp = level * 2 * level_xp_multiplier
-            required_xp = round(required_xp)
-            # Clamping required XP to max and min level XP values
-            if required_xp > max_level_experience:
-                required_xp = max_level_experience
-            elif required_xp < min_level_experience:
-                required_xp = min_level_experience
-            # Calculating percentage of XP progress
-            xp_percentage = int((xp / required_xp) * 100)
-            # Calculating remaining XP to next level
-            remaining_xp = required_xp - xp
-            # Sending progress message
-            embed = discord.Embed(color=discord.Color.green())
-            # Checking user is at max level or not
-            if user == ctx.author:
-                if level == max_level:
-                    embed.add_field(
-                        name=f"📊 Your progress:",
-                        value=f"Level: {level}\nYou are at the highest level you can reach!",
-                    )
-                else:
-                    embed.add_field(
-                        name=f"📊 Your progress:",
-                        value=f"Level: {level}\nXP: {xp}/{required_xp} ({xp_percentage}%)\nRemaining XP to next level: {remaining_xp}",
-                    )
-            else:
-                if level == max_level:
-                    embed.add_field(
-                        name=f"📊 {user}'s progress:",
-                        value=f"Level: {level}\nYou are at the highest level you can reach!",
+            level, xp = result
+            required_xp = levels.required_xp(level)
+            # Checking whose progress it is
+            owner = "Your" if user == ctx.author else f"{user}'s"
+            if not rank_cards.available:
+                # Sending progress message
+                await ctx.send(
+                    embed=responses.progress(
+                        owner, level, xp, required_xp, level == max_level
                     )
-                else:
-                    embed.add_field(
-                        name=f"📊 {user}'s progress:",
-                        value=f"Level: {level}\nXP: {xp}/{required_xp} ({xp_percentage}%)\nRemaining XP to next level: {remaining_xp}",
+                )
+                return
+            # Taking the user's rank for the rank card from the in-memory snapshot
+            rank = (await user_snapshot.get()).rank(user.id, level, xp)
+            avatar = user.display_avatar.replace(format="png", size=256)
+            try:
+                # Rendering the rank card, or reusing it if nothing on it has changed
+                card = await rank_cards.get_card(
+                    user.id,
+                    str(user),
+                    level,
+                    xp,
+                    required_xp,
+                    rank,
+                    level == max_level,
+                    avatar.key,
+                    avatar.read,
+                )
+            except (discord.DiscordException, OSError, BrokenProcessPool):
+                # If the avatar download or the rendering failed, send the progress without a card
+                await ctx.send(
+                    embed=responses.progress(
+                        owner, level, xp, required_xp, level == max_level
                     )
-            await ctx.send(embed=embed)
+                )
+                return
+            # Sending progress message with the rank card
+            embed = responses.progress(
+                owner,
+                level,
+                xp,
+                required_xp,
+                level == max_level,
+                image="attachment://rank_card.png",
+            )
+            await ctx.send(
+                embed=embed, file=discord.File(io.BytesIO(card), "rank_card.png")
+            )
 
-    # Command that gives information about all commands
-    @commands.command()
+    # Command to show level and xp statistics of the server
+    @commands.hybrid_command(description="Shows level and XP statistics of the server.")
     @cooldown(1, cooldown_duration_commands, BucketType.user)
-    async def help(self, ctx):
-        # Dictionary of all the commands and their descriptions
-        commands = {
-            "!leaderboard": "Displays the leaderboard of the top users in the server based on their level.",
-            "!progress @user or user_id [Optional]": "Displays the progress of a specific user in the server towards the next level.\nIf no user is specified, the command will display the progress of the user who invoked the command.",
-            "!help": "Shows a list of all the available commands and their descriptions.",
-            "!setlevel @user or user_id": "**[Admin Command]** Sets the level of a specific user in the server.",
-            "!addxp @user or user_id": "**[Admin Command]** Adds experience points to a specific user in the server.",
-            "!showadmins": "**[Admin Command]** Shows a list of all the admins in the database.",
-            "!deleteuser @user or user_id": "**[Super Admin Command]** Deletes a specific user's data from the server, including their level and experience points.",
-            "!deleteusers": "**[Super Admin Command]** Deletes all user data from the server, including their levels and experience points.",
-            "!addadmin @user or user_id": "**[Super Admin Command]** Adds a new admin to the database.",
-            "!removeadmin @user or user_id": "**[Super Admin Command]** Removes an admin from the database.",
-            "!resetall": "**[Super Admin Command]** Resets the level and XP of all users in the database.",
-        }
-        # Creating an embed message with the commands and their descriptions
-        embed = discord.Embed(
-            title="Help",
-            description="List of all available commands and their descriptions.",
-            color=0x00C3FF,
+    async def stats(self, ctx):
+        # Acknowledging slash commands right away, the reply is sent when it's ready
+        await ctx.defer()
+        snapshot = await user_snapshot.get()
+        description = f"{len(snapshot)} users in the database"
+        if not len(snapshot):
+            await ctx.send(embed=responses.embed(title="Server Stats", description=description))
+            return
+        percentiles = snapshot.level_percentiles()
+        percentile_rank = snapshot.percentile_rank(ctx.author.id)
+        embed = responses.embed(
+            title="Server Stats",
+            description=description,
+            fields=[
+                (
+                    "Active users",
+                    f"This week: {xp_buckets.active_count('week')}\nThis month: {xp_buckets.active_count('month')}",
+                    True,
+                ),
+                (
+                    "Level percentiles",
+                    "\n".join(
+                        f"{percent}th: Level {level}" for percent, level in percentiles.items()
+                    ),
+                    True,
+                ),
+                (
+                    "Users per level",
+                    "\n".join(
+                        f"Level {low}-{high}: {count}"
+                        for low, high, count in snapshot.level_histogram()
+                    ),
+                    False,
+                ),
+                (
+                    "Users per total XP",
+                    "\n".join(
+                        f"{low}-{high} XP: {count}"
+                        for low, high, count in snapshot.xp_histogram()
+                    ),
+                    False,
+                ),
+            ],
+            footer=f"You have more XP than {percentile_rank:.1f}% of users."
+            if percentile_rank is not None
+            else None,
         )
-        for command, description in commands.items():
-            embed.add_field(name=command, value=description, inline=False)
         await ctx.send(embed=embed)
 
+    # Command that gives information about all commands
+    @commands.hybrid_command(description="Shows a list of all the available commands.")
+    @cooldown(1, cooldown_duration_commands, BucketType.user)
+    async def help(self, ctx):
+        # The help embed never changes, so it is built once in responses
+        await ctx.send(embed=responses.HELP)
+
+    # Suggesting known user names from memory for the user argument
+    @progress.autocomplete("user")
+    async def progress_user_autocomplete(self, interaction, current):
+        return await name_index.autocomplete(interaction, current)
+
     @help.error
     async def command_error(self, ctx, error):
         if isinstance(error, CommandOnCooldown):
@@ -193,13 +326,9 @@ class user_commands(commands.Cog):
             if user_id not in self.help_cooldown_users:
                 self.help_cooldown_users.add(user_id)
                 remaining_time = math.ceil(error.retry_after)
-                embed = discord.Embed(color=discord.Color.orange())
-                embed.add_field(
-                    name=f"⚠️ {ctx.author} this command is on cooldown for you.",
-                    value=f"Please try again in {remaining_time} seconds.",
-                    inline=False,
+                cooldown_error = await ctx.send(
+                    embed=responses.COOLDOWN.render({"user": ctx.author, "seconds": remaining_time})
                 )
-                cooldown_error = await ctx.send(embed=embed)
                 await asyncio.sleep(remaining_time)
                 await cooldown_error.delete()
                 self.help_cooldown_users.remove(user_id)
@@ -212,13 +341,9 @@ class user_commands(commands.Cog):
             if user_id not in self.progress_cooldown_users:
                 self.progress_cooldown_users.add(user_id)
                 remaining_time = math.ceil(error.retry_after)
-                embed = discord.Embed(color=discord.Color.orange())
-                embed.add_field(
-                    name=f"⚠️ {ctx.author} this command is on cooldown for you.",
-                    value=f"Please try again in {remaining_time} seconds.",
-                    inline=False,
+                cooldown_error = await ctx.send(
+                    embed=responses.COOLDOWN.render({"user": ctx.author, "seconds": remaining_time})
                 )
-                cooldown_error = await ctx.send(embed=embed)
                 await asyncio.sleep(remaining_time)
                 await cooldown_error.delete()
                 self.progress_cooldown_users.remove(user_id)
@@ -231,17 +356,27 @@ class user_commands(commands.Cog):
             if user_id not in self.leaderboard_cooldown_users:
                 self.leaderboard_cooldown_users.add(user_id)
                 remaining_time = math.ceil(error.retry_after)
-                embed = discord.Embed(color=discord.Color.orange())
-                embed.add_field(
-                    name=f"⚠️ {ctx.author} this command is on cooldown for you.",
-                    value=f"Please try again in {remaining_time} seconds.",
-                    inline=False,
+                cooldown_error = await ctx.send(
+                    embed=responses.COOLDOWN.render({"user": ctx.author, "seconds": remaining_time})
                 )
-                cooldown_error = await ctx.send(embed=embed)
                 await asyncio.sleep(remaining_time)
                 await cooldown_error.delete()
                 self.leaderboard_cooldown_users.remove(user_id)
 
+    @stats.error
+    async def command_error(self, ctx, error):
+        if isinstance(error, CommandOnCooldown):
+            user_id = ctx.author.id
+            remaining_time = math.ceil(error.retry_after)
+            if user_id not in self.stats_cooldown_users:
+                self.stats_cooldown_users.add(user_id)
+                cooldown_error = await ctx.send(
+                    embed=responses.COOLDOWN.render({"user": ctx.author, "seconds": remaining_time})
+                )
+                await asyncio.sleep(remaining_time)
+                await cooldown_error.delete()
+                self.stats_cooldown_users.remove(user_id)
+
 
 def setup(bot):
     bot.add_cog(user_commands(bot))
@@ -1,16 +1,55 @@
 import sqlite3
+import time
 
 # Connecting to database
 try:
     conn = sqlite3.connect("level_system.db")
+    # Absolute path of the database, for connections opened later in worker threads
+    database_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    # WAL keeps appends to the xp event log cheap and lets readers run alongside them
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
     c.execute(
         """CREATE TABLE IF NOT EXISTS users
-                (id INTEGER PRIMARY KEY, name TEXT, level INTEGER, xp INTEGER)"""
+                (id INTEGER PRIMARY KEY, name TEXT, level INTEGER, xp INTEGER,
+                last_active REAL)"""
     )
+    # Adding last_active to databases created before it existed, counting everyone as active now
+    c.execute("PRAGMA table_info(users)")
+    if "last_active" not in [column[1] for column in c.fetchall()]:
+        c.execute("ALTER TABLE users ADD COLUMN last_active REAL")
+        c.execute("UPDATE users SET last_active = ?", (time.time(),))
     c.execute(
         """CREATE TABLE IF NOT EXISTS admins
                 (id INTEGER PRIMARY KEY, name TEXT)"""
     )
+    # Append-only log of every xp change, folded into users by the compactor
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS xp_events
+                (seq INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL, kind TEXT,
+                user_id INTEGER, name TEXT, amount INTEGER, level INTEGER,
+                xp INTEGER, actor_id INTEGER)"""
+    )
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS xp_events_state
+                (key TEXT PRIMARY KEY, value INTEGER)"""
+    )
+    # Xp earned per user per day, used for the weekly and monthly leaderboards
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS xp_daily
+                (user_id INTEGER, day INTEGER, xp INTEGER,
+                PRIMARY KEY (user_id, day))"""
+    )
+    # Per-guild xp settings as json (see important_files/guild_settings.py)
+    c.execute(
+        """CREATE TABLE IF NOT EXISTS guild_settings
+                (guild_id INTEGER PRIMARY KEY, settings TEXT)"""
+    )
+    conn.commit()
 except sqlite3.Error as e:
     print(f"Error connecting to database: {e}")
+
+
+# Opening another connection to the same database, for reading in a worker thread
+def open_reader():
+    return sqlite3.connect(database_path, check_same_thread=False)
@@ -0,0 +1,107 @@
+# Per-guild xp settings
+#
+# Every guild can override the keyword list, the on_message cooldown, the excluded
+# channels, per-channel xp multipliers and per-role xp boosts. Settings are stored as
+# json in the guild_settings table and resolved from an in-memory cache, so after the
+# first message of a guild no message needs a database query for them. Changing a
+# setting rewrites the row and drops the cached copy.
+import json
+import math
+import random
+import re
+
+from important_files import config
+from important_files.config import *
+from important_files.connection_to_database import *
+
+# Settings used by guilds that haven't changed anything
+DEFAULTS = {
+    "words": list(WORDS),
+    "cooldown": cooldown_duration_on_message,
+    "excluded_channels": [
+        int(channel_id) for channel_id in getattr(config, "excluded_channel_ids", ())
+    ],
+    "channel_multipliers": {},
+    "role_boosts": {},
+}
+
+
+class GuildSettings:
+    def __init__(self, data):
+        self.data = data
+        self.words = tuple(data["words"])
+        # One pattern for all words so a message is scanned once
+        self.words_pattern = re.compile(
+            "|".join(re.escape(word.lower()) for word in self.words) or r"(?!)"
+        )
+        self.cooldown = data["cooldown"]
+        self.excluded_channels = frozenset(data["excluded_channels"])
+        # Values that aren't finite numbers (saved before they were rejected) are ignored
+        self.channel_multipliers = {
+            int(channel_id): multiplier
+            for channel_id, multiplier in data["channel_multipliers"].items()
+            if math.isfinite(multiplier)
+        }
+        self.role_boosts = {
+            int(role_id): boost
+            for role_id, boost in data["role_boosts"].items()
+            if math.isfinite(boost)
+        }
+
+    # Returning the xp a member earns for one award in a channel
+    def xp_amount(self, channel_id, member):
+        multiplier = self.channel_multipliers.get(channel_id, 1)
+        if self.role_boosts:
+            # Only the member's best role boost counts
+            multiplier *= max(
+                (
+                    self.role_boosts[role.id]
+                    for role in getattr(member, "roles", ())
+                    if role.id in self.role_boosts
+                ),
+                default=1,
+            )
+        # The fraction of the multiplier is the chance of one more xp, so 0.3 gives 1 xp
+        # to 30% of awards and 1.5 gives 1 or 2 xp, matching the multiplier on average
+        whole = int(multiplier)
+        return whole + (random.random() < multiplier - whole)
+
+
+_cache = {}
+_defaults = GuildSettings(DEFAULTS)
+
+
+# Returning the settings of a guild (None for direct messages)
+def get(guild_id):
+    if guild_id is None:
+        return _defaults
+    settings = _cache.get(guild_id)
+    if settings is None:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT settings FROM guild_settings WHERE guild_id = ?", (guild_id,)
+        )
+        result = cursor.fetchone()
+        if result is None:
+            settings = _defaults
+        else:
+            settings = GuildSettings(dict(DEFAULTS, **json.loads(result[0])))
+        _cache[guild_id] = settings
+    return settings
+
+
+# Changing some settings of a guild and dropping its cached copy
+def update(guild_id, **changes):
+    cursor = conn.cursor()
+    cursor.execute("SELECT settings FROM guild_settings WHERE guild_id = ?", (guild_id,))
+    result = cursor.fetchone()
+    stored = json.loads(result[0]) if result is not None else {}
+    stored.update(changes)
+    cursor.execute(
+        "INSERT INTO guild_settings (guild_id, settings) VALUES (?, ?) "
+        "ON CONFLICT(guild_id) DO UPDATE SET settings = excluded.settings",
+        (guild_id, json.dumps(stored)),
+    )
+    conn.commit()
+    _cache.pop(guild_id, None)
+    return get(guild_id)
@@ -0,0 +1,65 @@
+# Duplicate suppression for messages and commands
+#
+# After a gateway reconnect or resume the same message can be delivered to on_message
+# again. Recently processed message ids and command idempotency keys are kept in
+# bounded, insertion ordered caches that forget keys after a while, so a repeated
+# delivery is dropped before it gives xp or runs a command a second time.
+import collections
+import time
+
+# Seconds a message id is remembered and the most ids kept
+MESSAGE_TTL = 15 * 60
+MAX_MESSAGES = 50_000
+# Seconds a command idempotency key is remembered and the most keys kept
+COMMAND_TTL = 60 * 60
+MAX_COMMANDS = 10_000
+
+# Kind ("message", "addxp", "resetall", ...) -> number of suppressed duplicates
+suppressed = collections.Counter()
+
+
+class RecentKeys:
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        # Key -> time it is forgotten, oldest first (every key lives for the same ttl)
+        self._keys = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _evict(self, now):
+        keys = self._keys
+        while keys and (len(keys) >= self.max_size or next(iter(keys.values())) <= now):
+            keys.popitem(last=False)
+
+    # Returning True if the key was seen recently, otherwise remembering it
+    def seen(self, key):
+        now = time.monotonic()
+        expires = self._keys.get(key)
+        if expires is not None and expires > now:
+            return True
+        self._evict(now)
+        self._keys[key] = now + self.ttl
+        return False
+
+
+messages = RecentKeys(MESSAGE_TTL, MAX_MESSAGES)
+commands = RecentKeys(COMMAND_TTL, MAX_COMMANDS)
+
+
+# Returning True (and counting it) if the message was already processed
+def duplicate_message(message_id):
+    if messages.seen(message_id):
+        suppressed["message"] += 1
+        return True
+    return False
+
+
+# Returning True (and counting it) if the command invocation was already run.
+# The key is the id of the invoking message, which is the interaction id for slash commands.
+def duplicate_command(kind, key):
+    if commands.seen((kind, key)):
+        suppressed[kind] += 1
+        return True
+    return False
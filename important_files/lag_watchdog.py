@@ -0,0 +1,130 @@
+# Event loop lag watchdog
+#
+# A task wakes up every CHECK_INTERVAL seconds and records how late it woke up in a
+# lag histogram. A helper thread watches the time of the last wake up, and when the
+# loop hasn't woken up for BLOCK_THRESHOLD seconds it captures the stack of the loop
+# thread while it is still blocked and writes it to a rotating log file, so the sync
+# code that blocked the loop can be found in production.
+import asyncio
+import collections
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Folder and file where the stacks of blocking calls are written
+LOG_DIR = "logs"
+LOG_FILE = "lag_watchdog.log"
+# Size of a log file before it is rotated and how many old files are kept
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 5
+# Seconds between two lag measurements
+CHECK_INTERVAL = 0.1
+# Seconds the loop has to be blocked before its stack is captured
+BLOCK_THRESHOLD = 0.25
+# Upper bounds (ms) of the lag histogram buckets, the last bucket has no upper bound
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# Bucket upper bound (None for the last one) -> number of measurements
+histogram = collections.Counter()
+# [measurements, blocks over the threshold, highest lag in seconds]
+totals = [0, 0, 0.0]
+
+_last_beat = None
+_loop_thread_id = None
+_monitor = None
+_watcher = None
+_logger = None
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            os.path.join(LOG_DIR, LOG_FILE),
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _logger = logging.getLogger("lag_watchdog")
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+    return _logger
+
+
+# Adding one lag measurement (seconds) to the histogram
+def record(lag):
+    lag_ms = lag * 1000
+    for bound in BUCKETS_MS:
+        if lag_ms <= bound:
+            histogram[bound] += 1
+            break
+    else:
+        histogram[None] += 1
+    totals[0] += 1
+    totals[2] = max(totals[2], lag)
+
+
+# Returning the lag histogram as (label, count) pairs, smallest lags first
+def buckets():
+    result = []
+    low = 0
+    for bound in BUCKETS_MS:
+        result.append((f"{low}-{bound} ms", histogram[bound]))
+        low = bound
+    result.append((f">{low} ms", histogram[None]))
+    return result
+
+
+async def _measure():
+    global _last_beat
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + CHECK_INTERVAL
+        await asyncio.sleep(CHECK_INTERVAL)
+        lag = max(loop.time() - expected, 0.0)
+        _last_beat = time.monotonic()
+        record(lag)
+        if lag >= BLOCK_THRESHOLD:
+            _get_logger().info(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+
+# Runs in the helper thread, so it keeps running while the loop thread is blocked
+def _watch():
+    reported_beat = None
+    while True:
+        time.sleep(BLOCK_THRESHOLD / 4)
+        beat = _last_beat
+        if beat is None or beat == reported_beat:
+            continue
+        blocked = time.monotonic() - beat - CHECK_INTERVAL
+        if blocked < BLOCK_THRESHOLD:
+            continue
+        # Only one stack per block, the measuring task logs how long it lasted
+        reported_beat = beat
+        frame = sys._current_frames().get(_loop_thread_id)
+        if frame is None:
+            continue
+        totals[1] += 1
+        stack = "".join(traceback.format_stack(frame))
+        _get_logger().info(
+            f"Event loop blocked for over {blocked * 1000:.0f} ms at:\n{stack}"
+        )
+
+
+# Starting the watchdog, must be called from the loop thread
+# (on_ready can fire again after a reconnect)
+def start():
+    global _loop_thread_id, _monitor, _watcher
+    if _monitor is None or _monitor.done():
+        _loop_thread_id = threading.get_ident()
+        _monitor = asyncio.create_task(_measure())
+    if _watcher is None:
+        _watcher = threading.Thread(target=_watch, name="lag-watchdog", daemon=True)
+        _watcher.start()
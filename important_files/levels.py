@@ -0,0 +1,53 @@
+# Level formula shared by every place that changes or shows xp
+import bisect
+import functools
+
+from important_files.config import *
+
+
+# Returning the xp needed to go from a level to the next one
+def required_xp(level):
+    required_xp = round(level * 2 * level_xp_multiplier)
+    # Check if required xp is within the defined range
+    if required_xp > max_level_experience:
+        required_xp = max_level_experience
+    elif required_xp < min_level_experience:
+        required_xp = min_level_experience
+    return required_xp
+
+
+# Adding xp to a level and xp, leveling up as many times as it reaches
+def add_xp(level, xp, amount):
+    xp += amount
+    while level < max_level and xp >= required_xp(level):
+        xp -= required_xp(level)
+        level += 1
+    # Clamp level to max level if it exceeds the max level
+    if level >= max_level:
+        level = max_level
+        xp = 0
+    return level, xp
+
+
+# Returning the total xp needed to reach every level 0..max_level from level 0
+@functools.lru_cache(maxsize=1)
+def cumulative_xp_table():
+    table = [0]
+    for level in range(max_level):
+        table.append(table[-1] + required_xp(level))
+    return table
+
+
+# Returning the total xp a user has earned from level 0 to their level and xp
+def total_xp(level, xp):
+    return cumulative_xp_table()[max(0, min(level, max_level))] + xp
+
+
+# Returning the (level, xp) reached with a total xp earned from level 0
+def from_total_xp(total):
+    table = cumulative_xp_table()
+    total = max(total, 0)
+    level = bisect.bisect_right(table, total) - 1
+    if level >= max_level:
+        return max_level, 0
+    return level, total - table[level]
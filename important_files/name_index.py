@@ -0,0 +1,80 @@
+# In-memory index of known user names for slash command autocomplete
+#
+# Names from the users table are kept in a sorted list of (lowercase name, name, id),
+# so every prefix search is a binary search and autocomplete never queries SQLite.
+# The index is loaded by the xp event log at startup and kept up to date by it.
+import bisect
+
+from discord import app_commands
+from discord.ext import commands
+
+from important_files.connection_to_database import *
+
+# Maximum number of choices Discord shows for an autocomplete
+MAX_CHOICES = 25
+
+# Sorted (lowercase name, name, user id) entries and the entry of every user id
+entries = []
+_by_id = {}
+
+
+def load():
+    entries.clear()
+    _by_id.clear()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name FROM users")
+    for user_id, name in cursor.fetchall():
+        if name:
+            entry = (name.lower(), name, user_id)
+            entries.append(entry)
+            _by_id[user_id] = entry
+    entries.sort()
+
+
+# Adding a user or updating their name
+def add(user_id, name):
+    entry = _by_id.get(user_id)
+    if entry is not None:
+        if entry[1] == name:
+            return
+        remove(user_id)
+    entry = (name.lower(), name, user_id)
+    bisect.insort(entries, entry)
+    _by_id[user_id] = entry
+
+
+# Removing a user, or every user when user_id is None
+def remove(user_id=None):
+    if user_id is None:
+        entries.clear()
+        _by_id.clear()
+        return
+    entry = _by_id.pop(user_id, None)
+    if entry is not None:
+        del entries[bisect.bisect_left(entries, entry)]
+
+
+# Returning up to limit (name, user id) pairs whose name starts with prefix
+def search(prefix, limit=MAX_CHOICES):
+    prefix = prefix.lower()
+    start = bisect.bisect_left(entries, (prefix,))
+    result = []
+    for lower_name, name, user_id in entries[start : start + limit]:
+        if not lower_name.startswith(prefix):
+            break
+        result.append((name, user_id))
+    return result
+
+
+# Autocomplete callback for user arguments of slash commands
+async def autocomplete(interaction, current):
+    return [
+        app_commands.Choice(name=name[:100], value=str(user_id))
+        for name, user_id in search(current)
+    ]
+
+
+# User argument that also works as an autocompleted option in slash commands
+# (the autocomplete value is the user's id, which UserConverter already understands)
+class KnownUser(commands.UserConverter):
+    pass
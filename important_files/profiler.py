@@ -0,0 +1,151 @@
+# Sampling profiler that runs inside the bot process
+#
+# A helper thread samples the event loop thread's stack at a fixed interval and counts
+# each collapsed stack, which is cheap enough to leave the bot running normally. While
+# profiling, new tasks are wrapped so the time every coroutine spends running and
+# awaiting is recorded too. The result is written in the collapsed-stack format that
+# flamegraph tools read.
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+from collections.abc import Coroutine
+
+# Folder where profiles are written
+PROFILE_DIR = "profiles"
+# Seconds between two stack samples
+SAMPLE_INTERVAL = 0.005
+
+
+# Coroutine proxy that measures the time spent running each step of the coroutine
+class _TimedCoroutine(Coroutine):
+    def __init__(self, coro, stats):
+        self._coro = coro
+        self._stats = stats
+        self._started = None
+
+    def _run(self, method, *args):
+        now = time.perf_counter()
+        if self._started is None:
+            self._started = now
+        try:
+            return method(*args)
+        except BaseException:
+            stats = self._stats
+            stats[0] += 1
+            stats[2] += time.perf_counter() - self._started
+            raise
+        finally:
+            self._stats[1] += time.perf_counter() - now
+
+    def send(self, value):
+        return self._run(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._run(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+
+class Profiler:
+    def __init__(self, loop, interval=SAMPLE_INTERVAL):
+        self.loop = loop
+        self.interval = interval
+        # Collapsed stack -> number of samples
+        self.stacks = collections.Counter()
+        # Coroutine name -> [finished calls, seconds running, seconds from start to finish]
+        self.coroutines = collections.defaultdict(lambda: [0, 0.0, 0.0])
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._previous_factory = None
+        self._previous_switch_interval = None
+
+    # Starting the sampler thread and the task timing, must be called from the loop thread
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self._previous_factory = self.loop.get_task_factory()
+        self.loop.set_task_factory(self._task_factory)
+        # The sampler only sees the loop thread when it gets the GIL, so hand it over
+        # more often than the sample interval or pure Python code would never be sampled
+        self._previous_switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._previous_switch_interval, self.interval / 5))
+        self._sampler = threading.Thread(
+            target=self._sample, name="profiler-sampler", daemon=True
+        )
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        sys.setswitchinterval(self._previous_switch_interval)
+        self.loop.set_task_factory(self._previous_factory)
+        self.duration = time.perf_counter() - self.started
+
+    def _task_factory(self, loop, coro, **kwargs):
+        name = getattr(coro, "__qualname__", type(coro).__name__)
+        coro = _TimedCoroutine(coro, self.coroutines[name])
+        if self._previous_factory is not None:
+            return self._previous_factory(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    def _sample(self):
+        thread_id = self._thread_id
+        stacks = self.stacks
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    # Returning the functions with the most samples at the top of the stack as (name, samples)
+    def top_functions(self, limit=10):
+        own = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        return own.most_common(limit)
+
+    # Returning the coroutines that spent the most time awaiting as (name, calls, running, awaiting)
+    def top_coroutines(self, limit=10):
+        result = [
+            (name, calls, running, total - running)
+            for name, (calls, running, total) in self.coroutines.items()
+            if calls
+        ]
+        result.sort(key=lambda item: item[3], reverse=True)
+        return result[:limit]
+
+    # Writing the collapsed stacks and coroutine timings to disk, returning the stack file path
+    def write(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S"))
+        with open(f"{base}.folded", "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        with open(f"{base}-coroutines.txt", "w", encoding="utf-8") as file:
+            file.write("coroutine\tcalls\trunning_s\tawaiting_s\n")
+            for name, calls, running, awaiting in self.top_coroutines(None):
+                file.write(f"{name}\t{calls}\t{running:.6f}\t{awaiting:.6f}\n")
+        return f"{base}.folded"
@@ -0,0 +1,229 @@
+# Rank card images for !progress
+#
+# Cards are drawn with Pillow in a process pool so rendering never blocks the event
+# loop or holds the bot's GIL. Every card is stored under a hash of what is drawn on
+# it (user id, level, xp, rank and avatar), in memory and on disk, both size bounded,
+# so asking for the same progress again costs a dictionary lookup.
+import asyncio
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import functools
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+# Folder where rendered cards are cached
+CARD_DIR = "rank_cards"
+# Maximum bytes of cards kept in memory and on disk
+MEMORY_CACHE_BYTES = 32 * 1024 * 1024
+DISK_CACHE_BYTES = 256 * 1024 * 1024
+# Number of processes rendering cards
+WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+WIDTH, HEIGHT = 800, 200
+AVATAR_SIZE = 160
+
+# Hash -> png bytes, oldest first
+_memory = collections.OrderedDict()
+_memory_bytes = 0
+_disk_bytes = None
+_disk_lock = threading.Lock()
+_pool = None
+
+# Cards can only be drawn when Pillow is installed
+available = importlib.util.find_spec("PIL") is not None
+
+
+# Returning the cache key of a card
+def card_key(user_id, level, xp, rank, avatar_key):
+    return hashlib.sha256(f"{user_id}:{level}:{xp}:{rank}:{avatar_key}".encode()).hexdigest()
+
+
+# Loading a font once per worker process
+@functools.lru_cache(maxsize=None)
+def _font(size):
+    from PIL import ImageFont
+
+    return ImageFont.load_default(size=size)
+
+
+# Drawing a card and returning it as png bytes (runs in a worker process)
+def render_card(name, level, xp, required_xp, rank, max_level_reached, avatar_bytes):
+    from PIL import Image, ImageDraw
+
+    card = Image.new("RGB", (WIDTH, HEIGHT), (35, 39, 42))
+    draw = ImageDraw.Draw(card)
+    margin = (HEIGHT - AVATAR_SIZE) // 2
+    if avatar_bytes:
+        avatar = Image.open(io.BytesIO(avatar_bytes)).convert("RGB")
+        avatar = avatar.resize((AVATAR_SIZE, AVATAR_SIZE))
+        mask = Image.new("L", (AVATAR_SIZE, AVATAR_SIZE), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, AVATAR_SIZE, AVATAR_SIZE), fill=255)
+        card.paste(avatar, (margin, margin), mask)
+    left = margin * 2 + AVATAR_SIZE
+    font = _font(32)
+    small_font = _font(22)
+    draw.text((left, 30), name, font=font, fill=(255, 255, 255))
+    draw.text((WIDTH - margin, 30), f"#{rank}", font=font, fill=(0, 195, 255), anchor="ra")
+    draw.text((left, 80), f"Level {level}", font=small_font, fill=(200, 200, 200))
+    # Progress bar
+    bar_top, bar_bottom = 125, 155
+    draw.rounded_rectangle(
+        (left, bar_top, WIDTH - margin, bar_bottom), radius=15, fill=(72, 75, 78)
+    )
+    progress = 1 if max_level_reached else min(xp / required_xp, 1)
+    if progress > 0:
+        right = left + max(int((WIDTH - margin - left) * progress), bar_bottom - bar_top)
+        draw.rounded_rectangle((left, bar_top, right, bar_bottom), radius=15, fill=(0, 195, 255))
+    label = "Max level" if max_level_reached else f"{xp}/{required_xp} XP"
+    draw.text((WIDTH - margin, 80), label, font=small_font, fill=(200, 200, 200), anchor="ra")
+    output = io.BytesIO()
+    # Cards are cached, so fast compression matters more than small files
+    card.save(output, format="PNG", compress_level=1)
+    return output.getvalue()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Spawned workers don't inherit the bot's sockets, threads or database connection.
+        # They import the main module (bot.py) again as __mp_main__, so bot.py and the
+        # modules it imports must not write to the database on import (see xp_events.init).
+        _pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def _remember(key, png):
+    global _memory_bytes
+    _memory[key] = png
+    _memory_bytes += len(png)
+    while _memory_bytes > MEMORY_CACHE_BYTES and len(_memory) > 1:
+        _, old = _memory.popitem(last=False)
+        _memory_bytes -= len(old)
+
+
+# Returning a cached card, checking memory first and then disk
+def cached_card(key):
+    png = _memory.get(key)
+    if png is not None:
+        _memory.move_to_end(key)
+        return png
+    path = os.path.join(CARD_DIR, f"{key}.png")
+    try:
+        with open(path, "rb") as file:
+            png = file.read()
+    except FileNotFoundError:
+        return None
+    _remember(key, png)
+    return png
+
+
+# Writing a card to disk and removing the oldest ones when the folder is too big
+def _store(key, png):
+    with _disk_lock:
+        _store_locked(key, png)
+
+
+def _store_locked(key, png):
+    global _disk_bytes
+    os.makedirs(CARD_DIR, exist_ok=True)
+    files = None
+    if _disk_bytes is None:
+        files = [entry for entry in os.scandir(CARD_DIR) if entry.is_file()]
+        _disk_bytes = sum(entry.stat().st_size for entry in files)
+    with open(os.path.join(CARD_DIR, f"{key}.png"), "wb") as file:
+        file.write(png)
+    _disk_bytes += len(png)
+    if _disk_bytes > DISK_CACHE_BYTES:
+        if files is None:
+            files = [entry for entry in os.scandir(CARD_DIR) if entry.is_file()]
+        # Evicting least recently written cards until the cache is 90% full
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            if _disk_bytes <= DISK_CACHE_BYTES * 0.9:
+                break
+            if entry.name == f"{key}.png":
+                continue
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            _disk_bytes -= size
+
+
+# Returning the png of a card, rendering it in the process pool if it isn't cached.
+# get_avatar is only awaited when the card has to be rendered.
+async def get_card(
+    user_id, name, level, xp, required_xp, rank, max_level_reached, avatar_key, get_avatar
+):
+    key = card_key(user_id, level, xp, rank, avatar_key)
+    png = cached_card(key)
+    if png is not None:
+        return png
+    global _pool
+    avatar_bytes = await get_avatar()
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        png = await loop.run_in_executor(
+            pool,
+            render_card,
+            name,
+            level,
+            xp,
+            required_xp,
+            rank,
+            max_level_reached,
+            avatar_bytes,
+        )
+    except concurrent.futures.process.BrokenProcessPool:
+        # A worker died and the pool can't be used anymore, the next card starts a new one
+        if _pool is pool:
+            _pool = None
+        raise
+    _remember(key, png)
+    await asyncio.to_thread(_store, key, png)
+    return png
+
+
+# Benchmark of cards per second, rendered and cached
+# Usage: python -m important_files.rank_cards [number of cards]
+async def _benchmark(count):
+    from PIL import Image
+
+    avatar = io.BytesIO()
+    Image.new("RGB", (256, 256), (200, 80, 80)).save(avatar, format="PNG")
+    avatar_bytes = avatar.getvalue()
+
+    async def get_avatar():
+        return avatar_bytes
+
+    # Starting the workers before timing
+    await asyncio.get_running_loop().run_in_executor(
+        _get_pool(), render_card, "warmup", 1, 0, 10, 1, False, avatar_bytes
+    )
+    for label in ("rendered", "cached"):
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                get_card(i, f"user{i}", i % 500, i % 10, 10, i, False, "bench", get_avatar)
+                for i in range(count)
+            )
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {count} cards in {elapsed:.2f}s ({count / elapsed:.0f} cards/s)")
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # Using a temporary folder so the benchmark never touches the real cache
+    CARD_DIR = os.path.join(tempfile.mkdtemp(prefix="rank-cards-"), CARD_DIR)
+    asyncio.run(_benchmark(count))
+    _get_pool().shutdown()
@@ -0,0 +1,269 @@
+# Embeds the bot replies with
+#
+# Every reply goes through this module. Replies that never change (help, permission
+# and error messages) are built once as embeds that are sent again and again, so a
+# send only costs their to_dict(). Dynamic replies (xp earned, level ups, progress,
+# cooldowns) are filled in from templates, so their wording lives in one place.
+# Benchmark of the cost of one reply: python -m important_files.responses
+import sys
+import time
+
+import discord
+
+# Embed colors
+RED = discord.Color.red().value
+GREEN = discord.Color.green().value
+ORANGE = discord.Color.orange().value
+BLUE = discord.Color.blue().value
+INFO = 0x00C3FF
+GREEN_COLOUR = discord.Colour(GREEN)
+
+
+# Returning an embed from its parts, fields are (name, value, inline)
+def embed(title=None, description=None, fields=(), color=INFO, footer=None, image=None):
+    result = discord.Embed(title=title, description=description, color=color)
+    for name, value, inline in fields:
+        result.add_field(name=name, value=value, inline=inline)
+    if footer is not None:
+        result.set_footer(text=footer)
+    if image is not None:
+        result.set_image(url=image)
+    return result
+
+
+# One field embed whose name, value and footer are format strings
+class Template:
+    def __init__(self, color, name, value="", footer=None, inline=False):
+        # The color, and the parts without placeholders, are built once instead of on every send
+        self.color = discord.Colour(color)
+        self.inline = inline
+        self.name = name.format_map
+        self._value = value
+        self._format_value = value.format_map if "{" in value else None
+        self.footer = footer.format_map if footer is not None else None
+
+    # Returning the field value of the template filled in with values
+    def value(self, values):
+        return self._value if self._format_value is None else self._format_value(values)
+
+    # Returning the embed of the template filled in with a dict of values
+    def render(self, values, image=None):
+        result = discord.Embed(colour=self.color)
+        result.add_field(name=self.name(values), value=self.value(values), inline=self.inline)
+        if self.footer is not None:
+            result.set_footer(text=self.footer(values))
+        if image is not None:
+            result.set_image(url=image)
+        return result
+
+
+def error(text, value="", footer=None):
+    return embed(fields=((text, value, False),), color=RED, footer=footer)
+
+
+def success(text, value="", footer=None):
+    return embed(fields=((text, value, False),), color=GREEN, footer=footer)
+
+
+def warning(text, value="", footer=None):
+    return embed(fields=((text, value, False),), color=ORANGE, footer=footer)
+
+
+# Static replies, shared by every send so they must never be changed
+NO_PERMISSION = error("⛔ You don't have enough permission for this command.")
+SERVER_ONLY = error("❌ This command can only be used in a server.")
+ALREADY_RUN = error("❌ This command has already been run.")
+NEED_USER = error("❌ You need to mention user or put user's id.")
+NEED_LEVEL = error("❌ You need to put level.")
+NEED_XP_AMOUNT = error("❌ You need to put xp amount.")
+USER_NOT_FOUND = error("❗ User not found in database.")
+BAD_TIME_RANGE = error("❌ Time range must be all, week or month.")
+MULTIPLIER_NOT_POSITIVE = error("❌ Multiplier must be greater than 0.")
+NEGATIVE_COOLDOWN = error("❌ The cooldown can't be negative.")
+NEGATIVE_MULTIPLIER = error("❌ The multiplier can't be negative.")
+NEGATIVE_BOOST = error("❌ The boost can't be negative.")
+MULTIPLIER_NOT_FINITE = error("❌ The multiplier must be a finite number.")
+BOOST_NOT_FINITE = error("❌ The boost must be a finite number.")
+NO_ADMINS = error("❌ There are no admins in the database.")
+NO_LEVEL_ROLES = error("❌ There are no level roles in the config.")
+PROFILE_RUNNING = error("❌ A profile is already running.")
+TIMED_OUT = error("❌ Command timed out. Please try again.")
+CANCELLED = error("❌ Command cancelled. No changes have been made.")
+RESET_WARNING = error(
+    "⚠️ WARNING: This action will reset all users' levels and XP. Are you sure?"
+)
+DELETE_ALL_WARNING = error(
+    "⚠️ WARNING: This action will delete all users with their levels and XP. Are you sure?"
+)
+
+# Commands and their descriptions shown by !help
+HELP_COMMANDS = {
+    "!leaderboard week, month or all [Optional]": "Displays the leaderboard of the top users in the server based on their level.\nWith week or month, ranks users by the XP they earned in the last 7 or 30 days.",
+    "!progress @user or user_id [Optional]": "Displays the progress of a specific user in the server towards the next level.\nIf no user is specified, the command will display the progress of the user who invoked the command.",
+    "!stats": "Shows level and XP statistics of the server.",
+    "!help": "Shows a list of all the available commands and their descriptions.",
+    "!whatif multiplier": "**[Admin Command]** Previews how levels would change with a different level XP multiplier.",
+    "!setlevel @user or user_id": "**[Admin Command]** Sets the level of a specific user in the server.",
+    "!addxp @user or user_id": "**[Admin Command]** Adds experience points to a specific user in the server.",
+    "!showadmins": "**[Admin Command]** Shows a list of all the admins in the database.",
+    "!syncroles": "**[Admin Command]** Gives or removes level roles of every member so they match their level.",
+    "!xpsettings": "**[Admin Command]** Shows the XP settings of this server.",
+    "!setwords word, word or default": "**[Admin Command]** Sets the words that give XP in this server.",
+    "!setcooldown seconds": "**[Admin Command]** Sets how long a user waits between two XP giving messages in this server.",
+    "!excludechannel #channel": "**[Admin Command]** Stops or starts giving XP for messages in a channel.",
+    "!channelmultiplier #channel multiplier": "**[Admin Command]** Multiplies the XP given in a channel (1 removes it).",
+    "!roleboost @role boost": "**[Admin Command]** Multiplies the XP earned by members with a role (1 removes it).",
+    "!deleteuser @user or user_id": "**[Super Admin Command]** Deletes a specific user's data from the server, including their level and experience points.",
+    "!deleteusers": "**[Super Admin Command]** Deletes all user data from the server, including their levels and experience points.",
+    "!addadmin @user or user_id": "**[Super Admin Command]** Adds a new admin to the database.",
+    "!removeadmin @user or user_id": "**[Super Admin Command]** Removes an admin from the database.",
+    "!resetall": "**[Super Admin Command]** Resets the level and XP of all users in the database.",
+    "!messagestats": "**[Super Admin Command]** Shows how many messages left the XP pipeline at each stage and how many duplicates were dropped.",
+    "!lagstats": "**[Super Admin Command]** Shows a histogram of how late the event loop has been running.",
+    "!profile seconds [Optional]": "**[Super Admin Command]** Profiles the running bot for a number of seconds (10 by default) and sends a summary.",
+    "!synccommands": "**[Super Admin Command]** Registers the slash commands with Discord.",
+}
+HELP = embed(
+    title="Help",
+    description="List of all available commands and their descriptions.",
+    fields=[(command, description, False) for command, description in HELP_COMMANDS.items()],
+)
+
+# Dynamic replies
+COOLDOWN = Template(
+    ORANGE,
+    "⚠️ {user} this command is on cooldown for you.",
+    "Please try again in {seconds} seconds.",
+)
+LEVEL_UP = Template(
+    GREEN,
+    "🎉 You've leveled up {user}, congratulations!",
+    footer="Your current level is {level}.\nFor the next level you must earn {required_xp} xp!",
+)
+XP_EARNED = Template(
+    GREEN,
+    "🎊 You've earned {earned} {user}!",
+    footer="XP: {xp}/{required_xp} ({percentage}%)",
+)
+PROGRESS = Template(
+    GREEN,
+    "📊 {owner} progress:",
+    "Level: {level}\nXP: {xp}/{required_xp} ({percentage}%)\nRemaining XP to next level: {remaining_xp}",
+    inline=True,
+)
+PROGRESS_MAX_LEVEL = Template(
+    GREEN,
+    "📊 {owner} progress:",
+    "Level: {level}\nYou are at the highest level you can reach!",
+    inline=True,
+)
+
+
+# Returning the values of the xp earned template
+def _xp_earned(user, amount, xp, required_xp):
+    return {
+        "user": user,
+        "earned": "an xp" if amount == 1 else f"{amount} xp",
+        "xp": xp,
+        "required_xp": required_xp,
+        "percentage": int((xp / required_xp) * 100),
+    }
+
+
+# Returning the embed of the xp earned by one message, awards is a list of
+# (user, amount, old level, level, xp, required xp)
+def xp_awards(awards):
+    if len(awards) == 1:
+        # The usual case, rendered straight from its template
+        user, amount, old_level, level, xp, required_xp = awards[0]
+        if level > old_level:
+            return LEVEL_UP.render({"user": user, "level": level, "required_xp": required_xp})
+        return XP_EARNED.render(_xp_earned(user, amount, xp, required_xp))
+    result = discord.Embed(colour=GREEN_COLOUR)
+    for user, amount, old_level, level, xp, required_xp in awards:
+        if level > old_level:
+            template = LEVEL_UP
+            values = {"user": user, "level": level, "required_xp": required_xp}
+        else:
+            template = XP_EARNED
+            values = _xp_earned(user, amount, xp, required_xp)
+        # Several users share the embed, so each one's details go in their field
+        result.add_field(name=template.name(values), value=template.footer(values), inline=False)
+    return result
+
+
+# Returning the progress embed of a user, owner is "Your" or "<user>'s"
+def progress(owner, level, xp, required_xp, max_level_reached, image=None):
+    if max_level_reached:
+        return PROGRESS_MAX_LEVEL.render({"owner": owner, "level": level}, image)
+    values = {
+        "owner": owner,
+        "level": level,
+        "xp": xp,
+        "required_xp": required_xp,
+        "percentage": int((xp / required_xp) * 100),
+        "remaining_xp": required_xp - xp,
+    }
+    return PROGRESS.render(values, image)
+
+
+# Rounds of the benchmark, the fastest one is shown
+ROUNDS = 5
+
+
+# Benchmark of the cost of rendering one reply, compared with building the embed field by field
+def _benchmark(count):
+    def built_no_permission():
+        embed = discord.Embed(color=discord.Color.red())
+        embed.add_field(
+            name="⛔ You don't have enough permission for this command.",
+            value="",
+            inline=False,
+        )
+        return embed.to_dict()
+
+    def built_level_up(user="user#1234", level=12, required_xp=29):
+        embed = discord.Embed(color=discord.Color.green())
+        embed.add_field(
+            name=f"🎉 You've leveled up {user}, congratulations!", value="", inline=False
+        )
+        embed.set_footer(
+            text=f"Your current level is {level}.\nFor the next level you must earn {required_xp} xp!"
+        )
+        return embed.to_dict()
+
+    def built_help():
+        embed = discord.Embed(
+            title="Help",
+            description="List of all available commands and their descriptions.",
+            color=0x00C3FF,
+        )
+        for command, description in HELP_COMMANDS.items():
+            embed.add_field(name=command, value=description, inline=False)
+        return embed.to_dict()
+
+    cases = {
+        "no permission (built)": built_no_permission,
+        "no permission (static)": lambda: NO_PERMISSION.to_dict(),
+        "help (built)": built_help,
+        "help (static)": lambda: HELP.to_dict(),
+        "level up (built)": built_level_up,
+        "level up (template)": lambda: xp_awards([("user#1234", 1, 11, 12, 0, 29)]).to_dict(),
+        "progress (template)": lambda: progress("Your", 12, 5, 29, False).to_dict(),
+    }
+
+    for label, render in cases.items():
+        # Keeping the best of a few rounds, so other work on the machine doesn't skew it
+        best = None
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            for _ in range(count):
+                render()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{label:<24} {best / count * 1e6:8.2f} µs per reply")
+
+
+if __name__ == "__main__":
+    # Usage: python -m important_files.responses [number of replies]
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,138 @@
+# Level role rewards
+#
+# Members get every role in level_roles whose level they have reached. Level changes
+# are queued per member and only the last one is kept, so a member who crosses many
+# levels at once (or levels up several times before the worker gets to them) gets a
+# single member edit with their final roles. Edits that fail with a server or network
+# error are queued again with a due time, so one failing member never holds up the others.
+import asyncio
+
+import discord
+
+from important_files import config
+from important_files.connection_to_database import *
+from important_files import xp_events
+
+# {level: role id} of the roles given at each level, e.g. {5: 123456789123456789}
+level_roles = {
+    int(level): int(role_id)
+    for level, role_id in getattr(config, "level_roles", {}).items()
+}
+reward_role_ids = frozenset(level_roles.values())
+
+# Seconds to wait before retrying an edit that failed with a server or network error
+RETRY_DELAY = 5
+# How many times an edit is retried before it is dropped
+MAX_ATTEMPTS = 5
+
+# Latest level waiting to be applied: {(guild id, user id): (level, attempts, due time)},
+# the due time is in event loop time and 0 means right away
+pending = {}
+_wakeup = asyncio.Event()
+_worker = None
+
+
+# Returning the reward role ids a member should have at a level
+def roles_for_level(level):
+    return {role_id for role_level, role_id in level_roles.items() if level >= role_level}
+
+
+# Queueing a member's new level, replacing any level still waiting for them
+def queue(guild, user_id, level):
+    if not level_roles or guild is None:
+        return
+    pending[(guild.id, user_id)] = (level, 0, 0)
+    _wakeup.set()
+
+
+# Queueing every member of a guild whose reward roles don't match their level
+def reconcile(guild):
+    if not level_roles or guild is None:
+        return 0
+    xp_events.compact()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, level FROM users")
+    levels = dict(cursor.fetchall())
+    queued = 0
+    for member in guild.members:
+        if member.bot:
+            continue
+        wanted = roles_for_level(levels.get(member.id, 0))
+        current = {role.id for role in member.roles if role.id in reward_role_ids}
+        if wanted != current:
+            pending[(guild.id, member.id)] = (levels.get(member.id, 0), 0, 0)
+            queued += 1
+    if queued:
+        _wakeup.set()
+    return queued
+
+
+# Applying one member's final reward roles with a single edit
+async def _apply(bot, guild_id, user_id, level):
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        return
+    member = guild.get_member(user_id)
+    if member is None:
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return
+    wanted = roles_for_level(level)
+    roles = [role for role in member.roles[1:] if role.id not in reward_role_ids]
+    roles += [role for role in (guild.get_role(role_id) for role_id in wanted) if role]
+    if {role.id for role in roles} == {role.id for role in member.roles[1:]}:
+        return
+    await member.edit(roles=roles, reason=f"Level {level} role rewards")
+
+
+# Queueing a failed edit again for later, unless a newer level was queued in the meantime
+def _retry(key, level, attempts):
+    due = asyncio.get_running_loop().time() + RETRY_DELAY
+    pending.setdefault(key, (level, attempts + 1, due))
+
+
+async def _run(bot):
+    loop = asyncio.get_running_loop()
+    while True:
+        _wakeup.clear()
+        now = loop.time()
+        ready = [key for key, (_, _, due) in pending.items() if due <= now]
+        if not ready:
+            # Sleeping until something is queued or the next retry is due
+            next_due = min((due for _, _, due in pending.values()), default=None)
+            try:
+                await asyncio.wait_for(
+                    _wakeup.wait(), None if next_due is None else next_due - now
+                )
+            except asyncio.TimeoutError:
+                pass
+            continue
+        for key in ready:
+            item = pending.get(key)
+            if item is None or item[2] > loop.time():
+                # Applied already, or queued again for a retry that isn't due yet
+                continue
+            level, attempts, _ = pending.pop(key)
+            try:
+                await _apply(bot, *key, level)
+            except discord.HTTPException as e:
+                # discord.py already retries rate limits itself
+                if attempts + 1 >= MAX_ATTEMPTS or e.status not in (429, 500, 502, 503, 504):
+                    print(f"Error giving level roles to {key[1]}: {e}")
+                    continue
+                _retry(key, level, attempts)
+            except Exception as e:
+                # Network errors and anything else must not stop the worker
+                if attempts + 1 >= MAX_ATTEMPTS:
+                    print(f"Error giving level roles to {key[1]}: {e!r}")
+                    continue
+                print(f"Retrying level roles of {key[1]} after an error: {e!r}")
+                _retry(key, level, attempts)
+
+
+# Starting the worker (on_ready can fire again after a reconnect)
+def start(bot):
+    global _worker
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(_run(bot))
@@ -0,0 +1,199 @@
+# Columnar snapshot of every user for server statistics
+#
+# The (id, level, xp) of all users is copied into contiguous NumPy arrays every few
+# minutes, in a worker thread so the event loop keeps running. !stats, percentile ranks
+# and what-if previews of a new level_xp_multiplier are computed with vectorized
+# operations over these arrays instead of SQL aggregates.
+import asyncio
+import time
+
+import numpy as np
+
+from important_files.config import *
+from important_files.connection_to_database import *
+from important_files import xp_events
+
+# Seconds between two refreshes of the snapshot
+REFRESH_INTERVAL = 300
+# Rows read and converted at a time when loading a snapshot
+CHUNK_SIZE = 10000
+
+
+class Snapshot:
+    def __init__(self, ids, levels, xp):
+        self.ids = ids
+        self.levels = levels
+        self.xp = xp
+        self.taken = time.time()
+        # Total xp earned by every user, sorted for percentile lookups
+        self.total_xp = total_xp(levels, xp, level_xp_multiplier)
+        self.sorted_total_xp = np.sort(self.total_xp)
+        self._index = {user_id: i for i, user_id in enumerate(ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Returning the share of users (0-100) with less total xp than the user, or None
+    def percentile_rank(self, user_id):
+        i = self._index.get(user_id)
+        if i is None or not len(self):
+            return None
+        below = np.searchsorted(self.sorted_total_xp, self.total_xp[i], side="left")
+        return below * 100 / len(self)
+
+    # Returning the leaderboard rank (1 is the top) of a user with the given level and xp,
+    # compared with the other users as they were when the snapshot was taken
+    def rank(self, user_id, level, xp):
+        total = total_xp(level, xp, level_xp_multiplier)
+        above = len(self) - np.searchsorted(self.sorted_total_xp, total, side="right")
+        # Not counting the user's own older total
+        i = self._index.get(user_id)
+        if i is not None and self.total_xp[i] > total:
+            above -= 1
+        return int(above) + 1
+
+    # Returning the 50th, 90th and 99th percentile levels
+    def level_percentiles(self):
+        if not len(self):
+            return {}
+        values = np.percentile(self.levels, (50, 90, 99), method="lower")
+        return dict(zip((50, 90, 99), values.tolist()))
+
+    # Returning (low, high, count) ranges of a histogram of levels
+    def level_histogram(self, bins=10):
+        return _histogram(self.levels, bins)
+
+    # Returning (low, high, count) ranges of a histogram of total xp per user
+    def xp_histogram(self, bins=10):
+        return _histogram(self.total_xp, bins)
+
+    # Changing the level and xp of users already in the snapshot without sorting everything again
+    def update(self, user_ids, new_levels, new_xp):
+        indexes = [self._index[user_id] for user_id in user_ids if user_id in self._index]
+        if not indexes:
+            return
+        keep = [user_id in self._index for user_id in user_ids]
+        indexes = np.array(indexes, dtype=np.int64)
+        old_totals = self.total_xp[indexes]
+        self.levels[indexes] = np.asarray(new_levels, dtype=np.int64)[keep]
+        self.xp[indexes] = np.asarray(new_xp, dtype=np.int64)[keep]
+        new_totals = total_xp(self.levels[indexes], self.xp[indexes], level_xp_multiplier)
+        self.total_xp[indexes] = new_totals
+        # Removing one copy of every old total and inserting the new ones in order
+        sorted_totals = self.sorted_total_xp
+        old_totals = np.sort(old_totals)
+        positions = np.searchsorted(sorted_totals, old_totals, side="left")
+        # Equal old totals sit next to each other, so each takes the next position
+        positions += np.arange(len(positions)) - np.searchsorted(old_totals, old_totals, side="left")
+        sorted_totals = np.delete(sorted_totals, positions)
+        new_totals = np.sort(new_totals)
+        self.sorted_total_xp = np.insert(
+            sorted_totals, np.searchsorted(sorted_totals, new_totals), new_totals
+        )
+
+    # Recalculating every user's level with a different multiplier, keeping their total xp
+    def what_if(self, multiplier):
+        table = cumulative_xp_table(multiplier)
+        totals = np.minimum(self.total_xp, table[-1])
+        new_levels = np.searchsorted(table, totals, side="right") - 1
+        # Levels don't go below min_level, except for users already under it (e.g. after !resetall)
+        new_levels = np.clip(new_levels, np.minimum(self.levels, min_level), max_level)
+        changes = new_levels - self.levels
+        return {
+            "levels": new_levels,
+            "up": int(np.count_nonzero(changes > 0)),
+            "down": int(np.count_nonzero(changes < 0)),
+            "same": int(np.count_nonzero(changes == 0)),
+            "mean_change": float(changes.mean()) if len(changes) else 0.0,
+            "max_level_users": int(np.count_nonzero(new_levels == max_level)),
+        }
+
+
+def _histogram(values, bins):
+    if not len(values):
+        return []
+    counts, edges = np.histogram(values, bins=bins)
+    edges = np.ceil(edges).astype(np.int64)
+    # Bins include their low edge, only the last one includes its high edge too
+    highs = edges[1:] - 1
+    highs[-1] = edges[-1]
+    return [
+        (low, high, count)
+        for low, high, count in zip(edges[:-1].tolist(), highs.tolist(), counts.tolist())
+        if count
+    ]
+
+
+# Returning the xp needed to go from every level 0..max_level to the next one
+def required_xp_table(multiplier):
+    levels = np.arange(max_level + 1)
+    required = np.round(levels * 2 * multiplier).astype(np.int64)
+    return np.clip(required, min_level_experience, max_level_experience)
+
+
+# Returning the total xp needed to reach every level 0..max_level from level 0
+def cumulative_xp_table(multiplier):
+    table = np.zeros(max_level + 1, dtype=np.int64)
+    np.cumsum(required_xp_table(multiplier)[:-1], out=table[1:])
+    return table
+
+
+# Returning the total xp earned by users at the given levels with the given xp
+def total_xp(levels, xp, multiplier):
+    table = cumulative_xp_table(multiplier)
+    return table[np.clip(levels, 0, max_level)] + xp
+
+
+_snapshot = None
+_refreshing = None
+
+
+# Reading the users table on a separate connection and building a snapshot from it
+def _load():
+    reader = open_reader()
+    try:
+        cursor = reader.execute("SELECT id, level, xp FROM users")
+        # Converting the rows in chunks, one big conversion would hold the GIL and stall the loop
+        chunks = [np.empty((0, 3), dtype=np.int64)]
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    finally:
+        reader.close()
+    data = np.concatenate(chunks)
+    return Snapshot(
+        np.ascontiguousarray(data[:, 0]),
+        np.ascontiguousarray(data[:, 1]),
+        np.ascontiguousarray(data[:, 2]),
+    )
+
+
+async def _refresh():
+    global _snapshot
+    await xp_events.compact_in_thread()
+    _snapshot = await asyncio.to_thread(_load)
+    return _snapshot
+
+
+# Loading a new snapshot from the users table in a worker thread, callers that ask
+# while a refresh is running wait for that one
+async def refresh():
+    global _refreshing
+    if _refreshing is None or _refreshing.done():
+        _refreshing = asyncio.ensure_future(_refresh())
+    return await asyncio.shield(_refreshing)
+
+
+# Returning the current snapshot, loading it if there is none or it is too old
+async def get():
+    if _snapshot is None or time.time() - _snapshot.taken > REFRESH_INTERVAL:
+        return await refresh()
+    return _snapshot
+
+
+# Applying level and xp changes to the current snapshot, if there is one
+def update(user_ids, new_levels, new_xp):
+    if _snapshot is not None:
+        _snapshot.update(user_ids, new_levels, new_xp)
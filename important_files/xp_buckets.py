@@ -0,0 +1,117 @@
+# Time-bucketed xp counters for the weekly and monthly leaderboards
+#
+# Every award adds to the user's bucket for the current day in the xp_daily table and
+# to in-memory rolling totals for each window. When the day changes, only the bucket
+# that fell out of each window is subtracted, so the totals never need a full scan.
+import heapq
+import time
+
+from important_files.connection_to_database import *
+
+DAY = 86400
+# Leaderboard windows and how many days (including today) they cover
+WINDOWS = {"week": 7, "month": 30}
+# Buckets older than the longest window are pruned
+RETENTION_DAYS = max(WINDOWS.values())
+
+# Rolling xp totals per window: {window: {user_id: xp}}
+totals = {window: {} for window in WINDOWS}
+_current_day = None
+
+
+def _today():
+    return int(time.time() // DAY)
+
+
+# Rebuilding the rolling totals from the stored buckets (the caller commits)
+def _load(today):
+    global _current_day
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM xp_daily WHERE day <= ?", (today - RETENTION_DAYS,))
+    for window, days in WINDOWS.items():
+        cursor.execute(
+            "SELECT user_id, SUM(xp) FROM xp_daily WHERE day > ? GROUP BY user_id",
+            (today - days,),
+        )
+        totals[window] = dict(cursor.fetchall())
+    _current_day = today
+
+
+# Moving the windows forward to today, subtracting the buckets that expired (the caller commits)
+def _roll():
+    global _current_day
+    today = _today()
+    if today == _current_day:
+        return
+    if _current_day is None or today - _current_day > RETENTION_DAYS:
+        _load(today)
+        return
+    cursor = conn.cursor()
+    for day in range(_current_day + 1, today + 1):
+        for window, days in WINDOWS.items():
+            window_totals = totals[window]
+            cursor.execute(
+                "SELECT user_id, xp FROM xp_daily WHERE day = ?", (day - days,)
+            )
+            for user_id, xp in cursor.fetchall():
+                left = window_totals.get(user_id, 0) - xp
+                if left > 0:
+                    window_totals[user_id] = left
+                else:
+                    window_totals.pop(user_id, None)
+    cursor.execute("DELETE FROM xp_daily WHERE day <= ?", (today - RETENTION_DAYS,))
+    _current_day = today
+
+
+# Moving the windows forward before reading them and committing the removal of expired buckets
+def _roll_for_read():
+    _roll()
+    conn.commit()
+
+
+# Adding xp to the user's bucket for today (the caller commits)
+def add(user_id, amount):
+    if amount <= 0:
+        return
+    _roll()
+    conn.execute(
+        "INSERT INTO xp_daily (user_id, day, xp) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id, day) DO UPDATE SET xp = xp + excluded.xp",
+        (user_id, _current_day, amount),
+    )
+    for window_totals in totals.values():
+        window_totals[user_id] = window_totals.get(user_id, 0) + amount
+
+
+# Removing the buckets of a user, or of every user when user_id is None (the caller commits)
+def remove(user_id=None):
+    if user_id is None:
+        conn.execute("DELETE FROM xp_daily")
+        for window_totals in totals.values():
+            window_totals.clear()
+    else:
+        conn.execute("DELETE FROM xp_daily WHERE user_id = ?", (user_id,))
+        for window_totals in totals.values():
+            window_totals.pop(user_id, None)
+
+
+# Returning the top users of a window as a list of (user_id, xp)
+def top(window, limit=5):
+    _roll_for_read()
+    return heapq.nlargest(limit, totals[window].items(), key=lambda item: item[1])
+
+
+# Returning (xp, rank) of a user in a window, or None if the user earned no xp in it
+def rank(window, user_id):
+    _roll_for_read()
+    window_totals = totals[window]
+    xp = window_totals.get(user_id)
+    if xp is None:
+        return None
+    return xp, sum(1 for other in window_totals.values() if other > xp) + 1
+
+
+# Returning the number of users that earned xp in a window
+def active_count(window):
+    _roll_for_read()
+    return len(totals[window])
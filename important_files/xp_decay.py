@@ -0,0 +1,156 @@
+# Xp decay of inactive users
+#
+# A user is active when they thank someone or are thanked, and the compactor keeps
+# users.last_active up to date from the xp event log. Once a day the users that have
+# been inactive for a while lose a share of their total xp, following decay_curve in
+# the config. The users table is read in small keyset chunks in a worker thread with
+# its own connection, and every chunk is written back on the event loop as decay events
+# in one transaction. Levels go down through the level formula, and the !stats
+# snapshot and level roles are updated for the changed users only.
+import asyncio
+import bisect
+import time
+
+from important_files import config
+from important_files.config import *
+from important_files.connection_to_database import *
+from important_files import levels, role_rewards, user_snapshot, xp_events
+
+# ((days inactive, percent of total xp lost per day), ...), e.g. ((30, 1), (90, 2))
+decay_curve = tuple(sorted(getattr(config, "decay_curve", ())))
+
+# Number of users read and written at a time
+CHUNK_SIZE = 500
+# Seconds between two checks whether a day has passed since the last decay
+CHECK_INTERVAL = 60 * 60
+# Most days of decay applied at once, e.g. after the bot was offline for a long time
+MAX_DAYS = 30
+
+DAY = 24 * 60 * 60
+
+
+def _today():
+    return int(time.time() // DAY)
+
+
+# Returning the percent of total xp lost per day after some days of inactivity
+def decay_percent(days_inactive):
+    i = bisect.bisect_right([days for days, _ in decay_curve], days_inactive)
+    return decay_curve[i - 1][1] if i else 0
+
+
+# Returning (user_id, name, old level, old xp, new level, new xp) of the users in one
+# chunk that lose xp and the last id read (runs in the worker thread)
+def _read_chunk(reader, after_id, now, days):
+    cutoff = now - decay_curve[0][0] * DAY
+    rows = reader.execute(
+        "SELECT id, name, level, xp, last_active FROM users "
+        "WHERE id > ? AND last_active < ? ORDER BY id LIMIT ?",
+        (after_id, cutoff, CHUNK_SIZE),
+    ).fetchall()
+    changes = []
+    for user_id, name, level, xp, last_active in rows:
+        percent = decay_percent((now - last_active) / DAY)
+        total = levels.total_xp(level, xp)
+        # Users never decay below the minimum level they can be set to
+        floor = levels.total_xp(min(level, min_level), 0)
+        new_total = max(int(total * (1 - percent / 100) ** days), floor)
+        if new_total < total:
+            changes.append((user_id, name, level, xp) + levels.from_total_xp(new_total))
+    return changes, rows[-1][0] if rows else None
+
+
+# Reading a value from xp_events_state, or None
+def _state(cursor, key):
+    cursor.execute("SELECT value FROM xp_events_state WHERE key = ?", (key,))
+    result = cursor.fetchone()
+    return result[0] if result is not None else None
+
+
+# Writing values to xp_events_state (the caller commits)
+def _set_state(cursor, **values):
+    cursor.executemany(
+        "INSERT INTO xp_events_state (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        list(values.items()),
+    )
+
+
+# Applying the decay of the days since the last run, returning the number of users decayed.
+# A run that failed or was stopped partway is resumed after the last chunk it committed,
+# so no user is decayed twice for the same day.
+async def run(bot=None):
+    if not decay_curve:
+        return 0
+    cursor = conn.cursor()
+    today = _today()
+    if _state(cursor, "decay_run_day") is None:
+        decayed_day = _state(cursor, "decayed_day")
+        if decayed_day is None:
+            # Starting to count from today the first time decay is enabled
+            _set_state(cursor, decayed_day=today)
+            conn.commit()
+            return 0
+        days = min(today - decayed_day, MAX_DAYS)
+        if days <= 0:
+            return 0
+        # Starting a run: its day, how many days it applies, when it started and the
+        # last user id it has decayed are kept until it is done
+        _set_state(
+            cursor,
+            decay_run_day=today,
+            decay_days=days,
+            decay_started=int(time.time()),
+            decay_after_id=0,
+        )
+        conn.commit()
+    decayed = await _decay(bot)
+    # The run is done, the next one starts from its day
+    _set_state(cursor, decayed_day=_state(cursor, "decay_run_day"))
+    cursor.execute(
+        "DELETE FROM xp_events_state WHERE key IN "
+        "('decay_run_day', 'decay_days', 'decay_started', 'decay_after_id')"
+    )
+    conn.commit()
+    return decayed
+
+
+async def _decay(bot):
+    # Folding new events first so last_active is up to date
+    xp_events.compact()
+    cursor = conn.cursor()
+    days = _state(cursor, "decay_days")
+    now = _state(cursor, "decay_started")
+    after_id = _state(cursor, "decay_after_id")
+    # Only one worker thread uses this connection at a time
+    reader = open_reader()
+    decayed = 0
+    try:
+        while True:
+            changes, last_id = await asyncio.to_thread(
+                _read_chunk, reader, after_id, now, days
+            )
+            if last_id is None:
+                break
+            after_id = last_id
+            # Moving the run forward in the same transaction as the decay of the chunk
+            _set_state(cursor, decay_after_id=after_id)
+            if not changes:
+                conn.commit()
+                continue
+            applied = xp_events.decay_many(changes)
+            decayed += len(applied)
+            user_snapshot.update(
+                [change[0] for change in applied],
+                [change[4] for change in applied],
+                [change[5] for change in applied],
+            )
+            for user_id, _, old_level, _, level, _ in applied:
+                if level != old_level and bot is not None:
+                    # Taking away level roles in every guild the user is in
+                    for guild in bot.guilds:
+                        if guild.get_member(user_id) is not None:
+                            role_rewards.queue(guild, user_id, level)
+    finally:
+        reader.close()
+    return decayed
@@ -0,0 +1,421 @@
+# Append-only xp event ledger
+#
+# Every xp change (message awards, admin grants, level sets, resets and deletes) is
+# appended to the xp_events table instead of overwriting the users row. Each event
+# stores the amount that was given and the user's resulting level and xp. The
+# compactor folds the resulting values of new events into users in the background,
+# and until then the latest state of a user is kept in memory so readers never see
+# stale values. A replay rebuilds users from the amounts instead, so events (like a
+# bad !setlevel) can be left out and everything after them is recalculated.
+import argparse
+import asyncio
+import time
+
+from important_files.config import *
+from important_files.connection_to_database import *
+from important_files import levels, name_index, xp_buckets
+
+# Event kinds
+AWARD = "award"  # xp earned from a thank you message
+GRANT = "grant"  # xp given by an admin with !addxp
+SET = "set"  # level set by an admin with !setlevel
+RESET = "reset"  # every user's level and xp reset with !resetall
+DELETE = "delete"  # user removed with !deleteuser, or every user with !deleteusers
+IMPORT = "import"  # users that existed before the ledger was introduced
+DECAY = "decay"  # xp lost by an inactive user (see important_files/xp_decay.py)
+
+# Events that touch every user when user_id is NULL
+BULK_KINDS = (RESET, DELETE)
+
+# Number of rows read per batch while folding the log
+FOLD_BATCH_SIZE = 10000
+# Seconds between background compactions
+COMPACTION_INTERVAL = 30
+
+# Latest state of users whose events are not compacted yet: {user_id: (name, level, xp, seq)}
+pending = {}
+
+
+# Reading the sequence number of the last event folded into users
+def _compacted_seq(cursor):
+    cursor.execute("SELECT value FROM xp_events_state WHERE key = 'compacted_seq'")
+    result = cursor.fetchone()
+    return result[0] if result is not None else None
+
+
+def _set_compacted_seq(cursor, seq):
+    cursor.execute(
+        "INSERT INTO xp_events_state (key, value) VALUES ('compacted_seq', ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (seq,),
+    )
+
+
+# Inserting an event without committing, returning its sequence number
+def _append(cursor, kind, user_id, name, amount, level, xp, actor_id):
+    cursor.execute(
+        "INSERT INTO xp_events (ts, kind, user_id, name, amount, level, xp, actor_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (time.time(), kind, user_id, name, amount, level, xp, actor_id),
+    )
+    # Keeping the weekly and monthly counters in the same transaction
+    if kind in (AWARD, GRANT):
+        xp_buckets.add(user_id, amount)
+    elif kind in BULK_KINDS:
+        xp_buckets.remove(user_id)
+    # Keeping the autocomplete names up to date
+    if kind == DELETE:
+        name_index.remove(user_id)
+    elif user_id is not None:
+        name_index.add(user_id, name)
+    return cursor.lastrowid
+
+
+# Appending an event to the log and returning its sequence number
+def record(kind, user_id, name, amount, level, xp, actor_id=None):
+    cursor = conn.cursor()
+    seq = _append(cursor, kind, user_id, name, amount, level, xp, actor_id)
+    conn.commit()
+    if kind in BULK_KINDS:
+        # Bulk and delete events invalidate the in-memory state, so fold them right away
+        compact()
+    else:
+        pending[user_id] = (name, level, xp, seq)
+    return seq
+
+
+# Adding xp to a user and appending the result to the log, returning
+# (old level, new level, new xp, whether the user was added to the database).
+# Reading the current state and appending the event happen in one step with no await
+# in between, so concurrent awards to the same user can never overwrite each other.
+def award(kind, user_id, name, amount, actor_id=None):
+    return award_many(kind, [(user_id, name, amount)], actor_id)[0][1:]
+
+
+# Adding xp to several users with one read and one transaction. recipients is a list of
+# (user_id, name, amount), and the result is a list of
+# (user_id, old level, new level, new xp, whether the user was added to the database).
+def award_many(kind, recipients, actor_id=None):
+    states = current_many([user_id for user_id, _, _ in recipients])
+    cursor = conn.cursor()
+    results = []
+    updates = {}
+    for user_id, name, amount in recipients:
+        state = states.get(user_id)
+        new_user = state is None
+        # New users start at the minimum level with no xp
+        old_level, xp = (min_level, 0) if new_user else state
+        level, xp = levels.add_xp(old_level, xp, amount)
+        seq = _append(cursor, kind, user_id, name, amount, level, xp, actor_id)
+        states[user_id] = (level, xp)
+        updates[user_id] = (name, level, xp, seq)
+        results.append((user_id, old_level, level, xp, new_user))
+    conn.commit()
+    pending.update(updates)
+    return results
+
+
+# Appending decay events in one transaction. changes is a list of
+# (user_id, name, old level, old xp, new level, new xp) read from users; users whose
+# level or xp changed since then are skipped. Returning the changes that were applied.
+# Anything the caller wrote before is committed in the same transaction.
+def decay_many(changes):
+    states = current_many([change[0] for change in changes])
+    cursor = conn.cursor()
+    applied = []
+    updates = {}
+    for user_id, name, old_level, old_xp, level, xp in changes:
+        if states.get(user_id) != (old_level, old_xp):
+            continue
+        amount = levels.total_xp(level, xp) - levels.total_xp(old_level, old_xp)
+        seq = _append(cursor, DECAY, user_id, name, amount, level, xp, None)
+        updates[user_id] = (name, level, xp, seq)
+        applied.append((user_id, name, old_level, old_xp, level, xp))
+    conn.commit()
+    pending.update(updates)
+    return applied
+
+
+# Returning the current (level, xp) of a user, or None if the user is not in the database
+def current(user_id):
+    return current_many([user_id]).get(user_id)
+
+
+# Returning {user_id: (level, xp)} of the users that are in the database
+def current_many(user_ids):
+    states = {}
+    missing = []
+    for user_id in user_ids:
+        state = pending.get(user_id)
+        if state is not None:
+            states[user_id] = (state[1], state[2])
+        else:
+            missing.append(user_id)
+    if missing:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT id, level, xp FROM users WHERE id IN ({', '.join('?' * len(missing))})",
+            missing,
+        )
+        for user_id, level, xp in cursor.fetchall():
+            states[user_id] = (level, xp)
+    return states
+
+
+# Adding the writes of the folded per-user states and last active times to writes
+def _flush(writes, states, active):
+    # New rows get the time of the user's last award, or the time they were added
+    upserts = [
+        (user_id, name, level, xp, active.get(user_id, added))
+        for user_id, (name, level, xp, added) in states.items()
+        if level is not None
+    ]
+    deletes = [(user_id,) for user_id, state in states.items() if state[1] is None]
+    if upserts:
+        writes.append(
+            (
+                "INSERT INTO users (id, name, level, xp, last_active) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name, "
+                "level = excluded.level, xp = excluded.xp",
+                upserts,
+            )
+        )
+    if deletes:
+        writes.append(("DELETE FROM users WHERE id = ?", deletes))
+    if active:
+        writes.append(
+            (
+                "UPDATE users SET last_active = MAX(COALESCE(last_active, 0), ?) WHERE id = ?",
+                [(ts, user_id) for user_id, ts in active.items()],
+            )
+        )
+    states.clear()
+    active.clear()
+
+
+# Applying the (statement, rows) writes of a fold to the users table (the caller commits)
+def _write(cursor, writes):
+    for statement, rows in writes:
+        cursor.executemany(statement, rows)
+
+
+# Returning the (level, xp) of a user after an event, recalculated from the amount the
+# event gave. state is the user's (level, xp) before it, or None if they are not in the database.
+def _recalculate(kind, state, amount, level, xp):
+    if kind in (AWARD, GRANT):
+        # New users start at the minimum level with no xp
+        return levels.add_xp(*(state or (min_level, 0)), amount)
+    if kind == DECAY and state is not None:
+        # Decay never goes below the floor it had when it was applied
+        floor = levels.total_xp(min(state[0], min_level), 0)
+        return levels.from_total_xp(max(levels.total_xp(*state) + amount, floor))
+    # Level sets, resets and imports store the level and xp they set
+    return level, xp
+
+
+# Folding every event after after_seq with the reader connection, returning the writes that
+# bring users up to date, the number of events and the last seq. Nothing is written, so this
+# can run in a worker thread with its own connection. With recalculate, levels and xp come from
+# the amounts of the events instead of the values stored with them, and events in the skipped
+# (first seq, last seq) ranges are left out.
+def _fold(db, after_seq, recalculate=False, skipped=()):
+    reader = db.cursor()
+    reader.execute(
+        "SELECT seq, ts, kind, user_id, name, amount, level, xp, actor_id FROM xp_events "
+        "WHERE seq > ? ORDER BY seq",
+        (after_seq,),
+    )
+    # (statement, rows) to run in order
+    writes = []
+    # {user_id: (name, level, xp, time the user was added)}, level is None for deletes
+    states = {}
+    # Users who thanked someone or were thanked: {user_id: time of their last award}
+    active = {}
+    # (level, xp) of every user while recalculating, kept across flushes
+    current = {}
+    count = 0
+    last_seq = after_seq
+    while True:
+        rows = reader.fetchmany(FOLD_BATCH_SIZE)
+        if not rows:
+            break
+        for seq, ts, kind, user_id, name, amount, level, xp, actor_id in rows:
+            last_seq = seq
+            if any(first <= seq <= last for first, last in skipped):
+                continue
+            if user_id is None and kind in BULK_KINDS:
+                # Bulk events apply to everything before them, so write out what we have first
+                _flush(writes, states, active)
+                if kind == RESET:
+                    writes.append(("UPDATE users SET level = ?, xp = ?", [(level, xp)]))
+                    current = dict.fromkeys(current, (level, xp))
+                else:
+                    writes.append(("DELETE FROM users", [()]))
+                    current.clear()
+            elif kind == DELETE:
+                states[user_id] = (name, None, None, ts)
+                active.pop(user_id, None)
+                current.pop(user_id, None)
+            else:
+                if recalculate:
+                    level, xp = _recalculate(kind, current.get(user_id), amount, level, xp)
+                    current[user_id] = (level, xp)
+                previous = states.get(user_id)
+                if previous is None or previous[1] is None:
+                    # Users that are new here were added by this event, the time is
+                    # only used when their row doesn't exist yet
+                    added = ts
+                else:
+                    added = previous[3]
+                states[user_id] = (name, level, xp, added)
+                # Only thank you messages count as activity, not admin changes or decay
+                if kind == AWARD:
+                    active[user_id] = ts
+                    if actor_id is not None:
+                        active[actor_id] = ts
+        count += len(rows)
+    _flush(writes, states, active)
+    return writes, count, last_seq
+
+
+# Folding new events into the users table
+def compact():
+    cursor = conn.cursor()
+    after_seq = _compacted_seq(cursor) or 0
+    return _store_fold(cursor, *_fold(conn, after_seq))
+
+
+# Folding new events like compact(), but reading and folding them in a worker thread with
+# its own connection. Only writing the result to users runs on the event loop.
+async def compact_in_thread():
+    cursor = conn.cursor()
+    after_seq = _compacted_seq(cursor) or 0
+    result = await asyncio.to_thread(_fold_in_thread, after_seq)
+    if (_compacted_seq(cursor) or 0) != after_seq:
+        # Something else compacted in the meantime (e.g. !leaderboard or a bulk event),
+        # so users may already be newer than this fold
+        return 0
+    return _store_fold(cursor, *result)
+
+
+def _fold_in_thread(after_seq):
+    reader = open_reader()
+    try:
+        return _fold(reader, after_seq)
+    finally:
+        reader.close()
+
+
+# Writing the result of a fold and dropping the in-memory states that are now stored in users
+def _store_fold(cursor, writes, count, last_seq):
+    _write(cursor, writes)
+    if count:
+        _set_compacted_seq(cursor, last_seq)
+    conn.commit()
+    for user_id, state in list(pending.items()):
+        if state[3] <= last_seq:
+            del pending[user_id]
+    return count
+
+
+# Returning the (first seq, last seq) ranges of events left out of replays
+def skipped_ranges():
+    cursor = conn.cursor()
+    cursor.execute("SELECT key, value FROM xp_events_state WHERE key LIKE 'skip:%'")
+    return sorted((int(key[5:]), last) for key, last in cursor.fetchall())
+
+
+# Rebuilding the users table from the whole log, recalculating levels and xp from the
+# amounts of the events. The events in skip, and every event after until, are left out
+# of this replay and of every later one. They stay in the log.
+def replay(until=None, skip=()):
+    cursor = conn.cursor()
+    ranges = [(seq, seq) for seq in skip]
+    if until is not None:
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM xp_events")
+        last = cursor.fetchone()[0]
+        if last > until:
+            ranges.append((until + 1, last))
+    # Durability doesn't matter while rebuilding, a failed replay can just be run again
+    conn.execute("PRAGMA synchronous = OFF")
+    try:
+        # Remembering what is left out, in the same transaction as the rebuild
+        cursor.executemany(
+            "INSERT INTO xp_events_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+            [(f"skip:{first}", last) for first, last in ranges],
+        )
+        cursor.execute("DELETE FROM users")
+        writes, count, last_seq = _fold(conn, 0, recalculate=True, skipped=skipped_ranges())
+        _write(cursor, writes)
+        _set_compacted_seq(cursor, last_seq)
+        conn.commit()
+    finally:
+        conn.execute("PRAGMA synchronous = FULL")
+    pending.clear()
+    name_index.load()
+    return count
+
+
+# Seeding the log with the existing users the first time the ledger is used
+def _seed():
+    cursor = conn.cursor()
+    if _compacted_seq(cursor) is not None:
+        return
+    cursor.execute("SELECT id, name, level, xp FROM users")
+    rows = cursor.fetchall()
+    now = time.time()
+    cursor.executemany(
+        "INSERT INTO xp_events (ts, kind, user_id, name, amount, level, xp) "
+        "VALUES (?, ?, ?, ?, 0, ?, ?)",
+        [(now, IMPORT, user_id, name, level, xp) for user_id, name, level, xp in rows],
+    )
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM xp_events")
+    _set_compacted_seq(cursor, cursor.fetchone()[0])
+    conn.commit()
+
+
+# Preparing the log before the bot starts. This is not done on import, because
+# the rank card workers import the bot's modules again and must not write to the database.
+def init():
+    _seed()
+    # Folding events left over from the last run before anything reads users
+    compact()
+    name_index.load()
+
+
+# Printing the events of a user, to find the seq of an event to leave out of a replay
+def print_log(user_id):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT seq, ts, kind, amount, level, xp, actor_id FROM xp_events "
+        "WHERE user_id = ? OR (user_id IS NULL AND kind IN (?, ?)) ORDER BY seq",
+        (user_id, RESET, DELETE),
+    )
+    for seq, ts, kind, amount, level, xp, actor_id in cursor.fetchall():
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+        print(f"{seq:>8}  {when}  {kind:<6}  amount {amount}  level {level}  xp {xp}  by {actor_id}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Folds or replays the xp event log.")
+    parser.add_argument("command", nargs="?", default="compact", choices=("compact", "replay", "log"))
+    parser.add_argument("user_id", nargs="?", type=int, help="user whose events log prints")
+    parser.add_argument("--until", type=int, help="replay: leave out every event after this seq")
+    parser.add_argument(
+        "--skip", type=int, action="append", default=[], help="replay: leave out this seq (repeatable)"
+    )
+    args = parser.parse_args()
+    init()
+    if args.command == "log":
+        if args.user_id is None:
+            parser.error("log needs a user id")
+        print_log(args.user_id)
+    else:
+        start = time.perf_counter()
+        if args.command == "replay":
+            count = replay(args.until, args.skip)
+        else:
+            count = compact()
+        elapsed = time.perf_counter() - start
+        print(f"{args.command}: {count} events in {elapsed:.2f}s")
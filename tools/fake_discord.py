@@ -0,0 +1,348 @@
+# Local stand-in for the Discord gateway and REST API
+#
+# It speaks just enough of both for discord.py to log in, connect and receive a guild,
+# so the whole bot can be driven offline. Messages are injected as MESSAGE_CREATE
+# events, and every REST call the bot makes is recorded (sends, fetches and anything
+# else) together with the time it arrived. Channel message sends can optionally be
+# rate limited the way Discord does, so 429 handling shows up in load tests too.
+import asyncio
+import collections
+import itertools
+import json
+import time
+
+from aiohttp import web
+
+# Snowflakes used for the fake bot, guild and channels
+BOT_ID = 100000000000000001
+GUILD_ID = 200000000000000001
+FIRST_CHANNEL_ID = 300000000000000001
+FIRST_MESSAGE_ID = 400000000000000001
+
+# Gateway opcodes
+DISPATCH = 0
+HEARTBEAT = 1
+IDENTIFY = 2
+RESUME = 6
+REQUEST_GUILD_MEMBERS = 8
+HELLO = 10
+HEARTBEAT_ACK = 11
+
+TIMESTAMP = "2024-01-01T00:00:00.000000+00:00"
+
+
+def user_payload(user_id, bot=False):
+    return {
+        "id": str(user_id),
+        "username": f"loaduser{user_id}" if not bot else "lespy",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def member_payload(user_id=None):
+    payload = {
+        "roles": [],
+        "joined_at": TIMESTAMP,
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+    if user_id is not None:
+        payload["user"] = user_payload(user_id, bot=user_id == BOT_ID)
+    return payload
+
+
+# discord.py only parses bodies whose content type is exactly application/json
+def json_response(data, status=200, headers=None):
+    headers = dict(headers or {}, **{"Content-Type": "application/json"})
+    return web.Response(body=json.dumps(data).encode(), status=status, headers=headers)
+
+
+class FakeDiscord:
+    def __init__(self, channel_count=20, rate_limit=None):
+        self.channel_ids = [FIRST_CHANNEL_ID + i for i in range(channel_count)]
+        # (messages, seconds) allowed per channel for sends, or None for no rate limits
+        self.rate_limit = rate_limit
+        self.ready = asyncio.Event()
+        # Everything the bot did: (arrival time, channel id, payload)
+        self.sends = []
+        self.fetches = []
+        # Number of REST calls per "METHOD path" with snowflakes replaced by {id}
+        self.requests = collections.Counter()
+        self.rate_limited = 0
+        # Called with (arrival time, channel id, payload) for every send
+        self.on_send = None
+        self._messages = {}
+        self._message_ids = itertools.count(FIRST_MESSAGE_ID)
+        self._sequence = itertools.count(1)
+        self._buckets = {}
+        self._ws = None
+        self._runner = None
+        self.url = None
+
+    # Starting the server and returning its base url
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_get("/gateway", self._gateway)
+        app.router.add_route("*", "/api/v{version}/{path:.*}", self._rest)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._ws is not None:
+            await self._ws.close()
+        await self._runner.cleanup()
+
+    # Pointing discord.py at this server instead of discord.com
+    def patch_discord(self):
+        import discord.gateway
+        import discord.http
+        import yarl
+
+        discord.http.Route.BASE = f"{self.url}/api/v10"
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(
+            self.url.replace("http", "ws", 1) + "/gateway"
+        )
+
+    # Building a message payload and storing it so the bot can fetch it later
+    def create_message(
+        self, content, author_id, channel_id=None, mentions=(), reference=None
+    ):
+        message_id = next(self._message_ids)
+        channel_id = channel_id or self.channel_ids[message_id % len(self.channel_ids)]
+        payload = {
+            "id": str(message_id),
+            "channel_id": str(channel_id),
+            "guild_id": str(GUILD_ID),
+            "author": user_payload(author_id, bot=author_id == BOT_ID),
+            "member": member_payload(),
+            "content": content,
+            "timestamp": TIMESTAMP,
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [
+                dict(user_payload(user_id), member=member_payload())
+                for user_id in mentions
+            ],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+            "flags": 0,
+        }
+        if reference is not None:
+            # The referenced message is left out so the bot has to fetch it over REST
+            payload["message_reference"] = {
+                "message_id": str(reference),
+                "channel_id": str(channel_id),
+                "guild_id": str(GUILD_ID),
+            }
+        self._messages[message_id] = payload
+        return payload
+
+    # Sending a MESSAGE_CREATE event to the bot, returning the message id
+    async def inject_message(self, *args, **kwargs):
+        payload = self.create_message(*args, **kwargs)
+        await self._dispatch("MESSAGE_CREATE", payload)
+        return int(payload["id"])
+
+    # Sending a MESSAGE_CREATE event for a message that was already sent, like after a resume
+    async def redeliver_message(self, message_id):
+        await self._dispatch("MESSAGE_CREATE", self._messages[message_id])
+
+    async def _dispatch(self, event, data):
+        await self._ws.send_str(
+            json.dumps({"op": DISPATCH, "t": event, "s": next(self._sequence), "d": data})
+        )
+
+    def _guild_payload(self):
+        return {
+            "id": str(GUILD_ID),
+            "name": "Load Test",
+            "owner_id": str(BOT_ID),
+            "unavailable": False,
+            "member_count": 1,
+            "large": False,
+            "roles": [
+                {
+                    "id": str(GUILD_ID),
+                    "name": "@everyone",
+                    "permissions": "1071698660928",
+                    "position": 0,
+                    "color": 0,
+                    "hoist": False,
+                    "managed": False,
+                    "mentionable": False,
+                    "flags": 0,
+                }
+            ],
+            "channels": [
+                {
+                    "id": str(channel_id),
+                    "type": 0,
+                    "name": f"load-{i}",
+                    "position": i,
+                    "permission_overwrites": [],
+                }
+                for i, channel_id in enumerate(self.channel_ids)
+            ],
+            "members": [member_payload(BOT_ID)],
+            "presences": [],
+            "voice_states": [],
+            "threads": [],
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+        }
+
+    async def _gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._ws = ws
+        await ws.send_str(
+            json.dumps({"op": HELLO, "d": {"heartbeat_interval": 41250}, "s": None, "t": None})
+        )
+        async for msg in ws:
+            if msg.type != web.WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            op = data["op"]
+            if op == HEARTBEAT:
+                await ws.send_str(json.dumps({"op": HEARTBEAT_ACK, "d": None}))
+            elif op in (IDENTIFY, RESUME):
+                await self._dispatch(
+                    "READY",
+                    {
+                        "v": 10,
+                        "user": user_payload(BOT_ID, bot=True),
+                        "guilds": [{"id": str(GUILD_ID), "unavailable": True}],
+                        "session_id": "load-test",
+                        "resume_gateway_url": self.url.replace("http", "ws", 1) + "/gateway",
+                        "application": {"id": str(BOT_ID), "flags": 0},
+                    },
+                )
+                await self._dispatch("GUILD_CREATE", self._guild_payload())
+                self.ready.set()
+            elif op == REQUEST_GUILD_MEMBERS:
+                await self._dispatch(
+                    "GUILD_MEMBERS_CHUNK",
+                    {
+                        "guild_id": str(GUILD_ID),
+                        "members": [member_payload(BOT_ID)],
+                        "chunk_index": 0,
+                        "chunk_count": 1,
+                        "nonce": data["d"].get("nonce"),
+                    },
+                )
+        return ws
+
+    # Checking the per-channel send bucket, returning the seconds to wait or 0
+    def _take_token(self, channel_id, now):
+        limit, per = self.rate_limit
+        window_start, used = self._buckets.get(channel_id, (now, 0))
+        if now - window_start >= per:
+            window_start, used = now, 0
+        if used >= limit:
+            return per - (now - window_start), window_start, used
+        self._buckets[channel_id] = (window_start, used + 1)
+        return 0, window_start, used + 1
+
+    async def _rest(self, request):
+        now = time.perf_counter()
+        path = request.match_info["path"]
+        parts = path.split("/")
+        route = "/".join("{id}" if part.isdigit() else part for part in parts)
+        self.requests[f"{request.method} {route}"] += 1
+
+        if route == "users/@me":
+            return json_response(user_payload(BOT_ID, bot=True))
+        if route == "oauth2/applications/@me":
+            return json_response(
+                {
+                    "id": str(BOT_ID),
+                    "name": "Lespy",
+                    "description": "",
+                    "icon": None,
+                    "bot_public": False,
+                    "bot_require_code_grant": False,
+                    "owner": user_payload(BOT_ID + 1),
+                    "verify_key": "",
+                    "flags": 0,
+                }
+            )
+        if route == "gateway/bot":
+            return json_response(
+                {
+                    "url": self.url.replace("http", "ws", 1) + "/gateway",
+                    "shards": 1,
+                    "session_start_limit": {
+                        "total": 1000,
+                        "remaining": 1000,
+                        "reset_after": 0,
+                        "max_concurrency": 1,
+                    },
+                }
+            )
+        if route == "channels/{id}/messages" and request.method == "POST":
+            channel_id = int(parts[1])
+            headers = {}
+            if self.rate_limit is not None:
+                retry_after, window_start, used = self._take_token(channel_id, now)
+                limit, per = self.rate_limit
+                reset_after = max(per - (now - window_start), 0)
+                headers = {
+                    "X-RateLimit-Limit": str(limit),
+                    "X-RateLimit-Remaining": str(max(limit - used, 0)),
+                    "X-RateLimit-Reset": str(time.time() + reset_after),
+                    "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+                    "X-RateLimit-Bucket": f"channel-{channel_id}",
+                }
+                if retry_after:
+                    self.rate_limited += 1
+                    return json_response(
+                        {
+                            "message": "You are being rate limited.",
+                            "retry_after": retry_after,
+                            "global": False,
+                        },
+                        status=429,
+                        headers=headers,
+                    )
+            if request.content_type == "application/json":
+                body = await request.json()
+            else:
+                # Messages with files are sent as multipart, keep the json part only
+                body = {}
+                reader = await request.multipart()
+                async for part in reader:
+                    if part.name == "payload_json":
+                        body = json.loads(await part.text())
+            self.sends.append((now, channel_id, body))
+            if self.on_send is not None:
+                self.on_send(now, channel_id, body)
+            payload = self.create_message(body.get("content") or "", BOT_ID, channel_id)
+            payload["embeds"] = body.get("embeds", [])
+            return json_response(payload, headers=headers)
+        if route == "channels/{id}/messages/{id}" and request.method == "GET":
+            channel_id, message_id = int(parts[1]), int(parts[3])
+            self.fetches.append((now, channel_id, message_id))
+            payload = self._messages.get(message_id)
+            if payload is None:
+                return json_response(
+                    {"message": "Unknown Message", "code": 10008}, status=404
+                )
+            return json_response(payload)
+        if request.method == "DELETE" or request.method == "PUT":
+            # Deletes and reactions only need to succeed
+            return web.Response(status=204)
+        return json_response({"message": "404: Not Found", "code": 0}, status=404)
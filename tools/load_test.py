@@ -0,0 +1,194 @@
+# End-to-end load test of the whole bot against the local fake Discord
+#
+# Usage: python -m tools.load_test --rate 2000 --duration 10
+#
+# The bot (bot.py and the three cogs) runs unchanged in this process, logged in to
+# tools.fake_discord. A warmup pass puts every target user in the database, then
+# thank you messages are injected at a fixed rate, each from a new author so the
+# on_message cooldown never hides them. Every xp reply names the user it was for,
+# which is how replies are matched to injected messages for the latency numbers.
+# The database is created in a temporary folder, the real one is never touched.
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Author ids start here so they never collide with target ids
+FIRST_AUTHOR_ID = 10**9
+FIRST_TARGET_ID = 1000
+# Seconds between two injection batches
+TICK = 0.01
+
+target_pattern = re.compile(r"loaduser(\d+)")
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(args):
+    # Importing the bot from a temporary folder so it gets its own database
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="lespy-load-"))
+    from tools.fake_discord import FakeDiscord
+
+    rate_limit = None
+    if args.rate_limit:
+        limit, per = args.rate_limit.split("/")
+        rate_limit = (int(limit), float(per))
+    fake = FakeDiscord(channel_count=args.channels, rate_limit=rate_limit)
+    await fake.start()
+    fake.patch_discord()
+
+    import bot
+    from important_files import idempotency
+
+    await bot.setup()
+    bot_task = asyncio.create_task(bot.bot.start("load-test-token"))
+    await asyncio.wait_for(bot.bot.wait_until_ready(), timeout=30)
+
+    # Injection times of messages still waiting for a reply, per target user
+    waiting = collections.defaultdict(collections.deque)
+    latencies = []
+
+    def on_send(now, channel_id, body):
+        for embed in body.get("embeds", []):
+            for field in embed.get("fields", []):
+                match = target_pattern.search(field.get("name", ""))
+                if match and waiting[int(match.group(1))]:
+                    latencies.append(now - waiting[int(match.group(1))].popleft())
+                    return
+
+    fake.on_send = on_send
+    targets = [FIRST_TARGET_ID + i for i in range(args.targets)]
+    authors = iter(range(FIRST_AUTHOR_ID, FIRST_AUTHOR_ID + 10**9))
+    # Messages authored by the targets that replies can point at
+    referenced = {
+        target: int(fake.create_message("hello", target)["id"]) for target in targets
+    }
+
+    # Warmup: adding every target to the database before timing
+    processed_before = sum(bot.message_stats.values())
+    for target in targets:
+        await fake.inject_message("thanks", next(authors), mentions=(target,))
+    while sum(bot.message_stats.values()) - processed_before < len(targets):
+        await asyncio.sleep(TICK)
+    warmup_sends = len(fake.sends)
+    warmup_requests = collections.Counter(fake.requests)
+    warmup_stages = collections.Counter(bot.message_stats)
+
+    # Open loop injection at the requested rate
+    injected = 0
+    start = time.perf_counter()
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= args.duration:
+            break
+        due = int(elapsed * args.rate) - injected
+        for _ in range(due):
+            target = targets[injected % len(targets)]
+            waiting[target].append(time.perf_counter())
+            if random.random() < args.reply_ratio:
+                message_id = await fake.inject_message(
+                    "thank you", next(authors), reference=referenced[target]
+                )
+            else:
+                message_id = await fake.inject_message(
+                    "thanks", next(authors), mentions=(target,)
+                )
+            if random.random() < args.duplicate_ratio:
+                # Delivered twice, the bot should only reply once
+                await fake.redeliver_message(message_id)
+            injected += 1
+        await asyncio.sleep(TICK)
+    inject_time = time.perf_counter() - start
+
+    # Waiting for the remaining replies
+    deadline = time.perf_counter() + args.drain
+    while len(latencies) < injected and time.perf_counter() < deadline:
+        await asyncio.sleep(TICK)
+    total_time = time.perf_counter() - start
+
+    await bot.bot.close()
+    await fake.stop()
+    bot_task.cancel()
+
+    requests = fake.requests - warmup_requests
+    report = {
+        "injected": injected,
+        "inject_rate": injected / inject_time,
+        "replies": len(latencies),
+        "missing_replies": injected - len(latencies),
+        "sends": len(fake.sends) - warmup_sends,
+        "fetches": requests["GET channels/{id}/messages/{id}"],
+        "rate_limited": fake.rate_limited,
+        "throughput": len(latencies) / total_time,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies, default=0) * 1000,
+        },
+        "requests": dict(requests),
+        "pipeline": dict(bot.message_stats - warmup_stages),
+        "duplicates": idempotency.suppressed["message"],
+    }
+    return report
+
+
+def print_report(report):
+    print(f"Injected:      {report['injected']} messages ({report['inject_rate']:.0f}/s)")
+    print(
+        f"Replies:       {report['replies']} ({report['throughput']:.0f}/s), "
+        f"{report['missing_replies']} missing"
+    )
+    print(f"Fetches:       {report['fetches']}")
+    print(f"Rate limited:  {report['rate_limited']} responses")
+    print(f"Duplicates:    {report['duplicates']} dropped")
+    latency = report["latency_ms"]
+    print(
+        f"Latency (ms):  p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+        f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}"
+    )
+    print("REST calls:")
+    for route, count in sorted(report["requests"].items(), key=lambda item: -item[1]):
+        print(f"  {count:>8}  {route}")
+    print("Pipeline stages:")
+    for stage, count in sorted(report["pipeline"].items(), key=lambda item: -item[1]):
+        print(f"  {count:>8}  {stage}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test of the bot.")
+    parser.add_argument("--rate", type=float, default=1000, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of injection")
+    parser.add_argument("--drain", type=float, default=30, help="seconds to wait for late replies")
+    parser.add_argument("--channels", type=int, default=20, help="number of channels")
+    parser.add_argument("--targets", type=int, default=500, help="number of users receiving xp")
+    parser.add_argument("--reply-ratio", type=float, default=0.1, help="share of replies instead of mentions")
+    parser.add_argument("--duplicate-ratio", type=float, default=0, help="share of messages delivered twice")
+    parser.add_argument("--rate-limit", help="per channel send limit like 5/5 (messages/seconds)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    report = asyncio.run(run(args))
+    print_report(report)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Concurrency stress test for xp awards
+#
+# Usage: python -m tools.stress_xp --awards 5000 --users 20
+#
+# Thousands of awards to a few users run as parallel tasks: message awards through
+# bot.award_xp (whose channel sends yield to the event loop) mixed with admin grants
+# of random amounts. Since adding xp is associative, every user's final level and xp
+# must equal a single add of all their xp, and the log must hold every amount. The
+# same load is also run through a read, await, write version of the old code to show
+# that the check catches lost updates. The database is created in a temporary folder.
+import argparse
+import asyncio
+import collections
+import os
+import random
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+
+    def __str__(self):
+        return f"stressuser{self.id}"
+
+
+class FakeChannel:
+    async def send(self, embed=None, **kwargs):
+        # Yielding like a real REST call would
+        await asyncio.sleep(random.random() / 1000)
+
+
+async def run(args):
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="lespy-stress-"))
+    import bot
+    from important_files import levels, xp_events
+    from important_files.config import min_level
+    from important_files.connection_to_database import conn
+
+    xp_events.init()
+    users = [FakeUser(1000 + i) for i in range(args.users)]
+    author = FakeUser(1)
+    expected = collections.Counter()
+
+    async def message_award(user):
+        message = types.SimpleNamespace(author=author, channel=FakeChannel(), guild=None)
+        await bot.award_xp(message, [(user, 1)])
+
+    async def admin_grant(user, amount):
+        await asyncio.sleep(random.random() / 1000)
+        xp_events.award(xp_events.GRANT, user.id, str(user), amount, author.id)
+
+    # The old way: read, await something, then write back what was read
+    async def naive_award(user, amount):
+        level, xp = xp_events.current(user.id) or (min_level, 0)
+        await asyncio.sleep(random.random() / 1000)
+        level, xp = levels.add_xp(level, xp, amount)
+        xp_events.record(xp_events.GRANT, user.id, str(user), amount, level, xp)
+
+    def check(label, after_seq=0):
+        xp_events.compact()
+        cursor = conn.cursor()
+        lost = 0
+        for user in users:
+            want = levels.add_xp(min_level, 0, expected[user.id])
+            cursor.execute("SELECT level, xp FROM users WHERE id = ?", (user.id,))
+            got = cursor.fetchone()
+            if got != want:
+                lost += 1
+        cursor.execute(
+            "SELECT COALESCE(SUM(amount), 0) FROM xp_events "
+            "WHERE seq > ? AND user_id BETWEEN ? AND ?",
+            (after_seq, users[0].id, users[-1].id),
+        )
+        logged = cursor.fetchone()[0]
+        print(
+            f"{label}: {args.awards} awards, {lost}/{len(users)} users with lost updates, "
+            f"{logged}/{sum(expected.values())} xp in the log"
+        )
+        return lost
+
+    tasks = []
+    for _ in range(args.awards):
+        user = random.choice(users)
+        if random.random() < 0.8:
+            expected[user.id] += 1
+            tasks.append(message_award(user))
+        else:
+            amount = random.randint(1, 50)
+            expected[user.id] += amount
+            tasks.append(admin_grant(user, amount))
+    await asyncio.gather(*tasks)
+    lost = check("award")
+
+    # Control run with the read, await, write pattern after deleting every user
+    start_seq = xp_events.record(xp_events.DELETE, None, None, 0, None, None)
+    expected.clear()
+    tasks = []
+    for _ in range(args.awards):
+        user = random.choice(users)
+        amount = random.randint(1, 50)
+        expected[user.id] += amount
+        tasks.append(naive_award(user, amount))
+    await asyncio.gather(*tasks)
+    check("read-await-write (control)", start_seq)
+    return lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency stress test for xp awards.")
+    parser.add_argument("--awards", type=int, default=5000, help="number of parallel awards")
+    parser.add_argument("--users", type=int, default=20, help="number of users receiving xp")
+    args = parser.parse_args()
+    lost = asyncio.run(run(args))
+    sys.exit(1 if lost else 0)
+
+
+if __name__ == "__main__":
+    main()